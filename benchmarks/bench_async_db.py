@@ -0,0 +1,107 @@
+# ===============================================================
+# LOAD BENCHMARK – THREADPOOL (DB_ASYNC=0) VS ASYNC EXECUTOR (DB_ASYNC=1)
+# ===============================================================
+# Drives the app in-process over ASGI at increasing concurrency and reports
+# throughput and p50/p99 latency for each DB access mode.
+#
+#   pip install httpx
+#   python benchmarks/bench_async_db.py --requests 2000 --concurrency 1 16 64
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def drive(total: int, concurrency: int) -> dict:
+    import httpx
+    import main
+
+    main.init_db()  # ASGITransport skips the lifespan hook
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        email = f"bench-{concurrency}@example.com"
+        await client.post("/register", json={"name": "Bench", "email": email, "password": "pw",
+                                             "role": "mitra", "tenant": "MH"})
+        login = await client.post("/login", json={"email": email, "password": "pw"})
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        latencies = []
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(i)
+
+        async def worker():
+            while True:
+                try:
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                if i % 4 == 0:
+                    r = await client.post("/mitra/requests", headers=headers,
+                                          json={"citizen_name": f"c{i}", "service_id": "bench"})
+                else:
+                    r = await client.get("/mitra/wallet", headers=headers)
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+    }
+
+
+def run_mode(mode: str, total: int, levels) -> list:
+    """Each mode gets a fresh process and database, since DB_ASYNC is read at import."""
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, DB_ASYNC=mode, PYTHONPATH=REPO_ROOT)
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--requests", str(total),
+             "--concurrency", *map(str, levels)],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        results = [asyncio.run(drive(args.requests, level)) for level in args.concurrency]
+        print(json.dumps(results))
+        return
+
+    print(f"{'mode':<12}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode, label in (("0", "threadpool"), ("1", "async")):
+        for row in run_mode(mode, args.requests, args.concurrency):
+            print(f"{label:<12}{row['concurrency']:>6}{row['throughput_rps']:>10}"
+                  f"{row['p50_ms']:>10}{row['p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,79 @@
+# ===============================================================
+# MICRO-BENCHMARK – AUTH DEPENDENCY CHAIN
+# ===============================================================
+# Times token verification cold (full JWT decode) vs. through the claims
+# cache, the require_role layer on top, and a full DB-free request through
+# FastAPI with the cache enabled and disabled.
+#
+#   pip install httpx
+#   python benchmarks/bench_auth.py --iterations 20000
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def per_call_us(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - started) / iterations * 1e6, 2)
+
+
+def child(iterations: int) -> dict:
+    import jwt
+    import main
+    from fastapi.testclient import TestClient
+
+    token = main.create_token({"user_id": "bench", "role": "msme", "tenant": "MH"})
+    checker = main.require_role(["msme"])
+    loop = asyncio.new_event_loop()
+
+    async def chain():
+        return await checker(await main.get_current_user(token))
+
+    results = {
+        "cache_size": main.JWT_CACHE_SIZE,
+        "jwt_decode_us": per_call_us(lambda: jwt.decode(token, main.VERIFYING_KEY, algorithms=[main.ALGORITHM]),
+                                     iterations),
+        "verify_us": per_call_us(lambda: main.token_cache.verify(token), iterations),
+        "dependency_chain_us": per_call_us(lambda: loop.run_until_complete(chain()), iterations // 10),
+    }
+    with TestClient(main.app) as client:
+        headers = {"Authorization": f"Bearer {token}"}
+        results["request_us"] = per_call_us(lambda: client.get("/msme/credit-score", headers=headers),
+                                            iterations // 20)
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.iterations)))
+        return
+
+    print(f"{'cache':>8}{'decode us':>12}{'verify us':>12}{'chain us':>12}{'request us':>12}")
+    for size in ("0", "10000"):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(os.environ, JWT_CACHE_SIZE=size, PYTHONPATH=REPO_ROOT)
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child",
+                                  "--iterations", str(args.iterations)],
+                                 cwd=workdir, env=env, capture_output=True, text=True, check=True)
+            row = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{row['cache_size']:>8}{row['jwt_decode_us']:>12}{row['verify_us']:>12}"
+              f"{row['dependency_chain_us']:>12}{row['request_us']:>12}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,60 @@
+# ===============================================================
+# MICRO-BENCHMARK – ROW-BY-ROW VS BATCHED CREDIT SCORING
+# ===============================================================
+# Scores every submitted loan in a seeded database three ways: one applicant
+# per feature query and model call (what a per-request scorer does), one
+# vectorized batch, and the same batch again with the memo cache warm.
+# Uses the bench_suite seed cache, so volumes follow --scale.
+#
+#   pip install httpx numpy
+#   python benchmarks/bench_credit_score.py --scale 0.1
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_suite import seeded_copy  # noqa: E402
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vk-bench-")
+    os.chdir(workdir)
+    seeded_copy(args.scale, args.seed, workdir)
+    import main
+    main.init_db()
+
+    with main.db_pool.connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT mitra_id, gstin FROM loan_applications WHERE status='submitted'")
+        applicants = c.fetchall()
+
+        cold = main.CreditScorer(0, 0)
+        row_by_row, row_s = timed(lambda: [cold.score(conn, a, g) for a, g in applicants])
+        batched, batch_s = timed(lambda: cold.score_many(conn, applicants))
+        warm = main.CreditScorer(len(applicants), main.CREDIT_SCORE_CACHE_TTL)
+        warm.score_many(conn, applicants)
+        cached, cached_s = timed(lambda: warm.score_many(conn, applicants))
+
+    assert row_by_row == batched == cached, "scoring paths disagree"
+    print(f"{len(applicants)} submitted loans, {len({a for a, _ in applicants})} applicants")
+    print(f"{'path':<14}{'total s':>10}{'loans/s':>12}{'us/loan':>10}")
+    for name, seconds in (("row-by-row", row_s), ("batched", batch_s), ("batched+memo", cached_s)):
+        print(f"{name:<14}{seconds:>10.3f}{len(applicants) / seconds:>12.0f}{seconds / len(applicants) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,91 @@
+# ===============================================================
+# LOAD BENCHMARK – /login UNDER CONCURRENT KDF LOAD
+# ===============================================================
+# Fires concurrent logins at increasing concurrency and reports login
+# throughput and p50/p99, plus the latency of a cheap endpoint probed at the
+# same time, to check that KDF work stays inside its own worker pool.
+#
+#   pip install httpx
+#   python benchmarks/bench_login.py --logins 200 --concurrency 1 8 32
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_level(client, total: int, concurrency: int) -> dict:
+    login_latencies, probe_latencies = [], []
+    remaining = list(range(total))
+    done = asyncio.Event()
+
+    async def login_worker():
+        while remaining:
+            remaining.pop()
+            started = time.perf_counter()
+            r = await client.post("/login", json={"email": "bench@example.com", "password": "bench-pw"})
+            r.raise_for_status()
+            login_latencies.append(time.perf_counter() - started)
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get("/")
+            probe_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.005)
+
+    prober = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await prober
+
+    return {
+        "concurrency": concurrency,
+        "logins_per_s": round(total / elapsed, 1),
+        "login_p50_ms": round(percentile(login_latencies, 50) * 1000, 1),
+        "login_p99_ms": round(percentile(login_latencies, 99) * 1000, 1),
+        "probe_p99_ms": round(percentile(probe_latencies, 99) * 1000, 1) if probe_latencies else None,
+    }
+
+
+async def bench(total: int, levels) -> list:
+    import httpx
+    import main
+
+    main.init_db()  # ASGITransport skips the lifespan hook
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/register", json={"name": "Bench", "email": "bench@example.com",
+                                             "password": "bench-pw", "role": "msme", "tenant": "MH"})
+        return [await run_level(client, total, level) for level in levels]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="vk-bench-"))
+    import main
+    print(f"KDF={main.PASSWORD_KDF} workers={main.PASSWORD_HASH_WORKERS} "
+          f"max_pending={main.PASSWORD_HASH_MAX_PENDING}")
+    print(f"{'conc':>6}{'login/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'probe p99 ms':>14}")
+    for row in asyncio.run(bench(args.logins, args.concurrency)):
+        print(f"{row['concurrency']:>6}{row['logins_per_s']:>10}{row['login_p50_ms']:>10}"
+              f"{row['login_p99_ms']:>10}{str(row['probe_p99_ms']):>14}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,104 @@
+# ===============================================================
+# MICRO-BENCHMARK – LIST RESPONSE SERIALIZATION PER ROW
+# ===============================================================
+# Encodes one full page (--rows) of each list endpoint's rows from a seeded
+# database three ways: the old path (SELECT *, a dict per row by position,
+# FastAPI's jsonable_encoder and JSONResponse), row models with orjson, and
+# row models with the stdlib fallback encoder. Fetch time is excluded; the
+# cost is per row, best of --repeat. Uses the bench_suite seed cache, so
+# volumes follow --scale.
+#
+#   pip install httpx orjson
+#   python benchmarks/bench_serialization.py --scale 0.01 --rows 1000
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_suite import seeded_copy  # noqa: E402
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def fetch(c, queries, limit: int) -> list:
+    rows = []
+    for sql, params in queries:
+        c.execute(sql + " LIMIT ?", params + [limit - len(rows)])
+        rows += c.fetchall()
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vk-bench-")
+    os.chdir(workdir)
+    seeded_copy(args.scale, args.seed, workdir)
+    import main
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    main.init_db()
+
+    audit = lambda select, filters=(), params=(): main.audit_partitions.queries(
+        c, select, list(filters), list(params), ("timestamp", "id"), None)
+    loans = lambda select: [main.keyset_query(select, ["status='submitted'"], [], ("created_at", "id"), None, False)]
+    with main.db_pool.connection() as conn:
+        c = conn.cursor()
+        shapes = [
+            ("audit-logs", main.AuditRow, audit("SELECT * FROM {audit}"), audit(main.AuditRow.select("{audit}")),
+             lambda l: {"id": l[0], "user_id": l[1], "role": l[2], "action": l[3], "ip": l[4], "time": l[5]}),
+            ("compliance-logs", main.ComplianceRow, audit("SELECT a.* FROM {audit} a"),
+             audit(main.ComplianceRow.select("{audit} a")),
+             lambda l: {"id": l[0], "user_id": l[1], "action": l[3], "time": l[5]}),
+            ("nbfc/loans", main.LoanQueueRow, loans("SELECT * FROM loan_applications"),
+             loans(main.LoanQueueRow.select("loan_applications")),
+             lambda l: {"id": l[0], "applicant": l[1], "gstin": l[4], "score": l[5], "amount": l[6]}),
+        ]
+        pages = [(name, model, fetch(c, old_q, args.rows), fetch(c, new_q, args.rows), serialize)
+                 for name, model, old_q, new_q, serialize in shapes]
+        analytics = main.load_analytics(c)
+
+    orjson = main.orjson
+    print(f"orjson {'installed' if orjson else 'not installed'}; us/row, best of {args.repeat}")
+    print(f"{'list':<17}{'rows':>6}{'before':>9}{'orjson':>9}{'stdlib':>9}{'speedup':>9}")
+    for name, model, old_rows, new_rows, serialize in pages:
+        before = lambda: JSONResponse(jsonable_encoder([serialize(r) for r in old_rows])).body
+        after = lambda: main.FastJSONResponse([model.of(r) for r in new_rows]).body
+        assert json.loads(before()) == json.loads(after()), f"{name}: bodies differ"
+        before_s = best_of(args.repeat, before)
+        after_s = best_of(args.repeat, after) if orjson else float("nan")
+        main.orjson = None
+        stdlib_s = best_of(args.repeat, after)
+        main.orjson = orjson
+        per_row = lambda s: s / max(1, len(new_rows)) * 1e6
+        fastest = after_s if orjson else stdlib_s
+        print(f"{name:<17}{len(new_rows):>6}{per_row(before_s):>9.2f}{per_row(after_s):>9.2f}"
+              f"{per_row(stdlib_s):>9.2f}{before_s / fastest:>8.1f}x")
+
+    # /admin/analytics now serves bytes encoded once per cache rebuild instead of once per request
+    before_s = best_of(args.repeat, lambda: JSONResponse(jsonable_encoder(analytics)).body)
+    after_s = best_of(args.repeat, lambda: main.dump_json(analytics))
+    print(f"analytics payload ({len(analytics['state_metrics'])} states): {before_s * 1e6:.1f} us per request before, "
+          f"{after_s * 1e6:.1f} us per cache rebuild after")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,94 @@
+# ===============================================================
+# STARTUP BENCHMARK – IMPORT AND LIFESPAN COLD START
+# ===============================================================
+# Times what a fresh worker pays before it can serve: `import main` and the
+# lifespan startup (migrations), each in a new interpreter, against an empty
+# database and an already-migrated one. Then starts --workers processes at
+# once on an empty database to check the migration lock: every worker must
+# come up and each migration must be applied exactly once.
+#
+#   python benchmarks/bench_startup.py --runs 10 --workers 8
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_FILE = "vyaparkendra_national.db"
+
+
+def child() -> dict:
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    async def start():
+        async with main.app.router.lifespan_context(main.app):
+            return time.perf_counter()
+
+    ready = asyncio.run(start())
+    return {
+        "import_ms": round((imported - started) * 1000, 1),
+        "startup_ms": round((ready - imported) * 1000, 1),
+        "ready_ms": round((ready - started) * 1000, 1),
+        "drivers": sorted(m for m in ("sqlite3", "psycopg2") if m in sys.modules),
+    }
+
+
+def spawn(workdir: str) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child"],
+                            cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def collect(proc: subprocess.Popen) -> dict:
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"worker failed:\n{err}")
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child()))
+        return
+
+    rows = {"empty db": [], "migrated db": []}
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            rows["empty db"].append(collect(spawn(workdir)))
+            rows["migrated db"].append(collect(spawn(workdir)))
+
+    print(f"{'scenario':<14}{'import ms':>11}{'startup ms':>12}{'ready ms':>10}  drivers")
+    for name, samples in rows.items():
+        med = lambda key: statistics.median(s[key] for s in samples)
+        print(f"{name:<14}{med('import_ms'):>11.1f}{med('startup_ms'):>12.1f}{med('ready_ms'):>10.1f}  "
+              f"{','.join(samples[-1]['drivers']) or '-'}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        results = [collect(p) for p in [spawn(workdir) for _ in range(args.workers)]]
+        elapsed = time.perf_counter() - started
+        conn = sqlite3.connect(os.path.join(workdir, DB_FILE))
+        applied, distinct = conn.execute("SELECT COUNT(*), COUNT(DISTINCT version) FROM schema_migrations").fetchone()
+        conn.close()
+    print(f"{args.workers} workers on an empty db: all ready in {elapsed * 1000:.0f} ms, "
+          f"slowest startup {max(r['startup_ms'] for r in results)} ms, "
+          f"{applied} migration rows ({'ok' if applied == distinct else 'DUPLICATES'})")
+
+
+if __name__ == "__main__":
+    main_cli()
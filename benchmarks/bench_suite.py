@@ -0,0 +1,394 @@
+# ===============================================================
+# LOAD BENCHMARK – SEEDED END-TO-END SUITE WITH JSON BASELINES
+# ===============================================================
+# Seeds a SQLite database through the app's own migrations at production-like
+# volumes (millions of ledger and audit rows, tens of thousands of mitras
+# across tenants), then drives the main flows in-process over ASGI and
+# reports throughput and p50/p95/p99 per flow. Results can be saved as a JSON
+# baseline and compared against on the next run, so regressions between
+# versions show up as a non-zero exit.
+#
+# Seeding is deterministic for a given --scale/--seed and cached under
+# benchmarks/.cache, so only the first run pays for it; every run works on a
+# fresh copy of the cached file.
+#
+#   pip install httpx
+#   python benchmarks/bench_suite.py --scale 0.01                       # quick smoke run
+#   python benchmarks/bench_suite.py --save benchmarks/baseline.json    # full volumes
+#   python benchmarks/bench_suite.py --compare benchmarks/baseline.json --tolerance 0.2
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(REPO_ROOT, "benchmarks", ".cache")
+sys.path.insert(0, REPO_ROOT)
+
+TENANTS = ["MH", "DL", "KA", "TN", "UP", "GJ", "WB", "RJ"]
+PASSWORD = "bench-pw"
+DB_FILE = "vyaparkendra_national.db"  # main.DB_FILE; importing main here would open it before the copy
+EPOCH = datetime(2026, 1, 1)
+
+# Row counts at --scale 1.0
+VOLUMES = {
+    "mitras": 20_000,
+    "msmes": 5_000,
+    "services_per_tenant": 25,
+    "service_requests": 500_000,
+    "ledger": 2_000_000,
+    "audit_logs": 2_000_000,
+    "loan_applications": 50_000,
+}
+SEED_BATCH = 50_000
+
+FLOWS = ["register", "login", "create_request", "complete_request", "wallet", "analytics", "compliance_logs"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# ---------------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------------
+
+def seed_database(scale: float, seed: int):
+    """Fill the app's database in the current directory. Runs in a child process."""
+    import main
+    main.init_db()
+
+    rng = random.Random(seed)
+    counts = {name: max(1, int(n * scale)) for name, n in VOLUMES.items()}
+    counts["services_per_tenant"] = VOLUMES["services_per_tenant"]
+    new_id = lambda: str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    stamp = lambda: (EPOCH + timedelta(seconds=rng.randrange(365 * 86400))).strftime("%Y-%m-%d %H:%M:%S.%f")
+    # One KDF run for every seeded account; per-user salts add nothing here
+    password_hash = main.hash_password(PASSWORD)
+
+    def batched(rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= SEED_BATCH:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    with main.db_pool.connection() as conn:
+        c = conn.cursor()
+        users, mitras, services = [], [], {t: [] for t in TENANTS}
+        users.append((new_id(), "Bench Admin", "admin@bench.local", password_hash, "admin", "MH", "approved", stamp()))
+        for t in TENANTS:
+            users.append((new_id(), f"Govt {t}", f"govt-{t.lower()}@bench.local", password_hash, "govt", t,
+                          "approved", stamp()))
+        for i in range(counts["mitras"]):
+            tenant = TENANTS[i % len(TENANTS)]
+            users.append((new_id(), f"Mitra {i}", f"mitra{i}@bench.local", password_hash, "mitra", tenant,
+                          "approved", stamp()))
+            mitras.append((users[-1][0], tenant))
+        for i in range(counts["msmes"]):
+            users.append((new_id(), f"MSME {i}", f"msme{i}@bench.local", password_hash, "msme",
+                          TENANTS[i % len(TENANTS)], "approved", stamp()))
+        c.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)", users)
+
+        service_rows = []
+        for t in TENANTS:
+            for i in range(counts["services_per_tenant"]):
+                price = float(rng.choice([50, 100, 250, 500, 1000]))
+                service_rows.append((new_id(), f"Service {t}-{i}", rng.choice(["GST", "PAN", "Bank", "Insurance"]),
+                                     price, round(price * 0.1, 2), t))
+                services[t].append(service_rows[-1])
+        c.executemany("INSERT INTO services VALUES (?, ?, ?, ?, ?, ?)", service_rows)
+
+        completed = []
+        def requests():
+            for i in range(counts["service_requests"]):
+                mitra_id, tenant = rng.choice(mitras)
+                service = rng.choice(services[tenant])
+                status = "completed" if rng.random() < 0.8 else "in_progress"
+                req_id = new_id()
+                if status == "completed":
+                    completed.append((req_id, mitra_id, service[4]))
+                yield (req_id, f"Citizen {i}", None, mitra_id, service[0], status, stamp())
+        for batch in batched(requests()):
+            c.executemany("INSERT INTO service_requests VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+
+        def ledger():
+            # Commissions for completed requests first, then payouts and adjustments
+            for req_id, mitra_id, commission in completed[:counts["ledger"]]:
+                yield (new_id(), mitra_id, commission, "credit", req_id, stamp())
+            for _ in range(counts["ledger"] - min(len(completed), counts["ledger"])):
+                mitra_id, _tenant = rng.choice(mitras)
+                kind = "debit" if rng.random() < 0.3 else "credit"
+                yield (new_id(), mitra_id, round(rng.uniform(5, 500), 2), kind, new_id(), stamp())
+        for batch in batched(ledger()):
+            c.executemany("INSERT INTO ledger VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+        def audit_logs():
+            actions = ["POST /mitra/requests", "GET /mitra/wallet", "User Login", "GET /msme/services"]
+            for _ in range(counts["audit_logs"]):
+                user = rng.choice(users)
+                yield (new_id(), user[0], user[4], rng.choice(actions), f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+                       stamp())
+        for batch in batched(audit_logs()):
+            main.audit_partitions.insert(conn, batch)
+
+        def loans():
+            for i in range(counts["loan_applications"]):
+                mitra_id, _tenant = rng.choice(mitras)
+                gstin = f"{rng.randrange(10, 38)}ABCDE{rng.randrange(1000, 9999)}F1Z{rng.randrange(10)}"
+                yield (new_id(), f"Applicant {i}", mitra_id, None, gstin, rng.randrange(300, 900),
+                       float(rng.randrange(10_000, 1_000_000, 1000)),
+                       rng.choice(["submitted", "submitted", "approved", "rejected", "disbursed"]), stamp())
+        for batch in batched(loans()):
+            c.executemany("INSERT INTO loan_applications VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+        # Derived tables, exactly as the write paths would have left them
+        main.reconcile_wallets(conn, fix=True)
+        c.execute("""UPDATE platform_counters SET value = CASE name
+            WHEN 'total_mitras' THEN (SELECT COUNT(*) FROM users WHERE role='mitra')
+            WHEN 'total_requests' THEN (SELECT COUNT(*) FROM service_requests)
+            WHEN 'total_revenue' THEN (SELECT COALESCE(SUM(amount), 0) FROM ledger WHERE type='credit')
+            ELSE value + 1 END""")
+        c.execute("""INSERT INTO state_analytics
+            SELECT 'seed-' || u.tenant, u.tenant,
+                   COALESCE(SUM(CASE WHEN r.status='completed' THEN s.price END), 0), COUNT(*), ?
+            FROM service_requests r JOIN users u ON u.id = r.mitra_id JOIN services s ON s.id = r.service_id
+            GROUP BY u.tenant""", (main.utc_timestamp(),))
+        main.backfill_rollups(conn)
+    with main.db_pool.connection() as conn:
+        conn.cursor().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    main.db_pool.close()
+    return counts
+
+
+def seeded_copy(scale: float, seed: int, workdir: str) -> str:
+    """Copy the cached seed database for (scale, seed) into workdir, building it first if needed."""
+    cached = os.path.join(CACHE_DIR, f"seed-s{scale:g}-r{seed}.db")
+    if not os.path.exists(cached):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with tempfile.TemporaryDirectory() as seeddir:
+            print(f"Seeding scale={scale:g} seed={seed} (cached at {cached})...", flush=True)
+            started = time.perf_counter()
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--seed-only",
+                            "--scale", str(scale), "--seed", str(seed)],
+                           cwd=seeddir, env=dict(os.environ, PYTHONPATH=REPO_ROOT), check=True)
+            shutil.move(os.path.join(seeddir, DB_FILE), cached)
+            print(f"Seeded in {time.perf_counter() - started:.1f}s", flush=True)
+    target = os.path.join(workdir, DB_FILE)
+    shutil.copyfile(cached, target)
+    return target
+
+
+# ---------------------------------------------------------------
+# Flows
+# ---------------------------------------------------------------
+
+async def run_flow(name: str, total: int, concurrency: int, make_call) -> dict:
+    latencies, errors = [], 0
+    pending = list(range(total))
+
+    async def worker():
+        nonlocal errors
+        while pending:
+            i = pending.pop()
+            started = time.perf_counter()
+            r = await make_call(i)
+            latencies.append(time.perf_counter() - started)
+            if r.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "flow": name,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def drive(counts: dict, total: int, concurrency: int, flows) -> list:
+    import httpx
+    import main
+
+    # ASGITransport skips the lifespan hook; the cached seed may predate newer migrations
+    main.init_db()
+    rng = random.Random(0)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def token(email: str) -> dict:
+            r = await client.post("/login", json={"email": email, "password": PASSWORD})
+            r.raise_for_status()
+            return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        # Session setup is not measured: one token per worker slot and role
+        mitra_ids = rng.sample(range(counts["mitras"]), min(concurrency, counts["mitras"]))
+        mitra_headers = [await token(f"mitra{i}@bench.local") for i in mitra_ids]
+        admin_headers = await token("admin@bench.local")
+        govt_headers = [await token(f"govt-{t.lower()}@bench.local") for t in TENANTS]
+        services = {}
+        with main.db_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, tenant FROM services ORDER BY id")
+            for service_id, tenant in c.fetchall():
+                services.setdefault(tenant, []).append(service_id)
+        created = []
+        run_id = uuid.uuid4().hex[:8]
+
+        def mitra(i):
+            slot = i % len(mitra_headers)
+            return slot, mitra_headers[slot], services[TENANTS[mitra_ids[slot] % len(TENANTS)]]
+
+        async def register(i):
+            return await client.post("/register", json={"name": f"New {i}", "email": f"new-{run_id}-{i}@bench.local",
+                                                        "password": PASSWORD, "role": "mitra", "tenant": TENANTS[i % 8]})
+
+        async def login(i):
+            return await client.post("/login", json={"email": f"mitra{rng.randrange(counts['mitras'])}@bench.local",
+                                                     "password": PASSWORD})
+
+        async def create_request(i):
+            slot, headers, tenant_services = mitra(i)
+            r = await client.post("/mitra/requests", headers=headers,
+                                  json={"citizen_name": f"Citizen {i}", "service_id": rng.choice(tenant_services)})
+            if r.status_code == 200:
+                created.append((slot, r.json()["request_id"]))
+            return r
+
+        async def complete_request(i):
+            slot, req_id = created.pop()
+            return await client.post(f"/mitra/requests/{req_id}/complete", headers=mitra_headers[slot])
+
+        async def wallet(i):
+            return await client.get("/mitra/wallet", headers=mitra(i)[1])
+
+        async def analytics(i):
+            return await client.get("/admin/analytics", headers=admin_headers)
+
+        async def compliance_logs(i):
+            return await client.get("/govt/compliance-logs", headers=govt_headers[i % len(govt_headers)])
+
+        calls = {"register": register, "login": login, "create_request": create_request,
+                 "complete_request": complete_request, "wallet": wallet, "analytics": analytics,
+                 "compliance_logs": compliance_logs}
+        results = []
+        for name in flows:
+            n = min(total, len(created)) if name == "complete_request" else total
+            results.append(await run_flow(name, n, concurrency, calls[name]))
+        return results
+
+
+# ---------------------------------------------------------------
+# Baselines
+# ---------------------------------------------------------------
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """Print deltas against a saved baseline; True if any flow regressed beyond tolerance."""
+    base = {row["flow"]: row for row in baseline["flows"]}
+    regressed = False
+    print(f"\nvs baseline {baseline['meta']['revision']} ({baseline['meta']['created_at']}):")
+    print(f"{'flow':<18}{'req/s Δ':>10}{'p95 Δ':>10}{'p99 Δ':>10}")
+    for row in current["flows"]:
+        old = base.get(row["flow"])
+        if old is None:
+            continue
+        rps = row["throughput_rps"] / old["throughput_rps"] - 1
+        p95 = row["p95_ms"] / old["p95_ms"] - 1
+        p99 = row["p99_ms"] / old["p99_ms"] - 1
+        bad = rps < -tolerance or p95 > tolerance
+        regressed = regressed or bad
+        print(f"{row['flow']:<18}{rps:>+10.1%}{p95:>+10.1%}{p99:>+10.1%}{'  REGRESSED' if bad else ''}")
+    if baseline["meta"].get("scale") != current["meta"]["scale"]:
+        print("warning: baseline was recorded at a different --scale")
+    return regressed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0, help="fraction of the full seed volumes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per flow")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--flows", nargs="+", choices=FLOWS, default=FLOWS)
+    parser.add_argument("--save", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop / p95 growth before --compare exits 1")
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_only:
+        print(json.dumps(seed_database(args.scale, args.seed)))
+        return 0
+
+    save = os.path.abspath(args.save) if args.save else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = tempfile.mkdtemp(prefix="vk-bench-")
+    os.chdir(workdir)
+    seeded_copy(args.scale, args.seed, workdir)
+    counts = {name: max(1, int(n * args.scale)) for name, n in VOLUMES.items()}
+    flows = list(args.flows)
+    if "complete_request" in flows and "create_request" not in flows:
+        flows.insert(flows.index("complete_request"), "create_request")
+
+    results = asyncio.run(drive(counts, args.requests, args.concurrency, flows))
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "seed": args.seed,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "volumes": counts,
+        },
+        "flows": results,
+    }
+
+    print(f"{'flow':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for row in results:
+        print(f"{row['flow']:<18}{row['throughput_rps']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+              f"{row['p99_ms']:>10}{row['errors']:>8}")
+
+    os.chdir(REPO_ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    if save:
+        with open(save, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            if compare(report, json.load(f), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
@@ -4,30 +4,119 @@
 # ===============================================================
 
 import os
+import time
+import asyncio
+import functools
+import inspect
+import base64
+import queue
 import uuid
 import hashlib
+import hmac
+import json
+import threading
+import re
+import csv
+import tempfile
+import gzip
+import heapq
+import sys
+import contextvars
+from collections import Counter, OrderedDict, deque
 import jwt
-import sqlite3
-import psycopg2
-from datetime import datetime, timedelta
-from typing import Optional, List
-from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, List
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
+
+try:
+    import orjson  # optional: list and analytics responses fall back to the stdlib encoder
+except ImportError:
+    orjson = None
 
 # ===============================================================
 # CONFIGURATION & ENVIRONMENT VARIABLES
 # ===============================================================
 
 SECRET_KEY = os.getenv("SECRET_KEY", "SUPER_SECRET_KEY")
-ALGORITHM = "HS256"
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")  # RS256 verifies with public.pem, no shared secret
+JWT_PRIVATE_KEY_FILE = os.getenv("JWT_PRIVATE_KEY_FILE", "private.pem")
+JWT_PUBLIC_KEY_FILE = os.getenv("JWT_PUBLIC_KEY_FILE", "public.pem")
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))  # 0 disables the claims cache
+PASSWORD_KDF = os.getenv("PASSWORD_KDF", "scrypt")  # scrypt or pbkdf2_sha256
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 16)))
 DATABASE_URL = os.getenv("DATABASE_URL")
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID", "")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET", "")
 DB_FILE = "vyaparkendra_national.db"
-
-app = FastAPI(title="VyaparKendra National Platform", version="2.0.0")
+SHARD_MAP = os.getenv("SHARD_MAP", "")  # JSON {"MH": "<sqlite path or postgres DSN>", ...}, inline or a file path
+SHARD_DIR = os.getenv("SHARD_DIR") or None  # unmapped tenants get SHARD_DIR/vyaparkendra_<tenant>.db (SQLite only)
+SHARD_TENANTS = os.getenv("SHARD_TENANTS", "")  # comma-separated tenants allowed a new SHARD_DIR shard, e.g. "MH,DL,KA"
+SHARD_POOL_SIZE = int(os.getenv("SHARD_POOL_SIZE", os.getenv("DB_POOL_SIZE", "10")))
+SHARD_FANOUT_WORKERS = int(os.getenv("SHARD_FANOUT_WORKERS", "8"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", "30"))
+DB_ASYNC = os.getenv("DB_ASYNC", "1") == "1"  # 0 = run handlers in the shared threadpool
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_BACKPRESSURE = os.getenv("AUDIT_BACKPRESSURE", "block")  # block, drop_newest, drop_oldest
+AUDIT_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "5"))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "0"))  # 0 = write-through
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "5"))
+ANALYTICS_CACHE_SWR = float(os.getenv("ANALYTICS_CACHE_SWR", "30"))  # 0 = always refresh inline
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 1000
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "1"))  # seconds between version checks
+CREDIT_SCORE_CACHE_SIZE = int(os.getenv("CREDIT_SCORE_CACHE_SIZE", "50000"))  # 0 disables score memoization
+CREDIT_SCORE_CACHE_TTL = float(os.getenv("CREDIT_SCORE_CACHE_TTL", "60"))  # bounds staleness from request/loan activity
+GST_SPOOL_DIR = os.getenv("GST_SPOOL_DIR") or None  # where uploads are spooled; default is the system temp dir
+GST_MAX_UPLOAD_BYTES = int(os.getenv("GST_MAX_UPLOAD_BYTES", str(2 * 1024 ** 3)))
+GST_INDEX_MAX_ENTRIES = int(os.getenv("GST_INDEX_MAX_ENTRIES", "200000"))  # unmatched invoices kept in memory
+GST_MATCH_TOLERANCE = float(os.getenv("GST_MATCH_TOLERANCE", "1.0"))  # rupees
+GST_PARSE_WORKERS = int(os.getenv("GST_PARSE_WORKERS", "0"))  # >1 parses file chunks in worker processes
+GST_CHUNK_BYTES = int(os.getenv("GST_CHUNK_BYTES", str(8 * 1024 ** 2)))
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "90"))  # daily partitions kept in the database
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))  # seconds a stored response is replayed
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "300"))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"  # 0 = no /metrics data and no DB statement timing
+METRICS_MAX_STATEMENTS = int(os.getenv("METRICS_MAX_STATEMENTS", "500"))  # distinct SQL labels before "other"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")  # X-Profile: <token> samples one request; empty disables
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"  # 0 = a release step runs `python main.py migrate`
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing below may touch the DB before the schema is current
+    if MIGRATE_ON_STARTUP:
+        init_db()
+    audit_writer.start()
+    yield
+    audit_writer.close()
+    analytics_buffer.close()
+    password_hasher.close()
+    adb.close()
+    tenant_router.close()
+    db_pool.close()
+
+app = FastAPI(title="VyaparKendra National Platform", version="2.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,23 +124,746 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing", "Idempotent-Replayed"],
 )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# ===============================================================
+# METRICS
+# ===============================================================
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+class _RequestStats:
+    """DB time for one HTTP request, carried in a contextvar across executor hops."""
+    __slots__ = ("db_seconds", "statements")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.statements: dict = {}
+
+_request_stats: contextvars.ContextVar[Optional[_RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+class RequestMetrics:
+    """Process-local counters rendered in the Prometheus text format.
+
+    Requests are keyed by (method, route template, status) so path parameters
+    do not explode the label set. SQL is labelled by its normalized text, which
+    stays bounded because every statement is parameterized; past max_statements
+    distinct labels the rest are counted as "other". Each gunicorn worker keeps
+    its own numbers, so scrape every worker (or sum them) for a full picture.
+    """
+
+    _IN_LIST = re.compile(r"\(\?(?:, \?)+\)")
+
+    def __init__(self, enabled: bool, max_statements: int):
+        self.enabled = enabled
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._requests: dict = {}
+        self._request_db: dict = {}
+        self._statements: dict = {}
+        self._labels: dict = {}
+
+    def statement_label(self, sql: str) -> str:
+        label = self._labels.get(sql)
+        if label is None:
+            label = self._IN_LIST.sub("(?...)", " ".join(sql.split()))
+            if len(self._labels) < self.max_statements:
+                self._labels[sql] = label
+            elif label not in self._statements:
+                label = "other"
+        return label
+
+    def observe_statement(self, sql: str, seconds: float, calls: int = 1):
+        label = self.statement_label(sql)
+        with self._lock:
+            count, total = self._statements.get(label, (0, 0.0))
+            self._statements[label] = (count + calls, total + seconds)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.db_seconds += seconds
+            count, total = stats.statements.get(label, (0, 0.0))
+            stats.statements[label] = (count + calls, total + seconds)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: _RequestStats):
+        key = (method, route, str(status))
+        with self._lock:
+            hist = self._requests.get(key)
+            if hist is None:
+                hist = self._requests[key] = _Histogram()
+                self._request_db[key] = _Histogram()
+            hist.observe(seconds)
+            self._request_db[key].observe(stats.db_seconds)
+
+    @staticmethod
+    def _labels_text(**labels) -> str:
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+    def _render_histograms(self, lines: List[str], name: str, help_text: str, histograms: dict):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (method, route, status), hist in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, hist.counts):
+                cumulative += count
+                labels = self._labels_text(method=method, route=route, status=status, le=repr(bound))
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = self._labels_text(method=method, route=route, status=status, le="+Inf")
+            lines.append(f"{name}_bucket{labels} {hist.count}")
+            labels = self._labels_text(method=method, route=route, status=status)
+            lines.append(f"{name}_sum{labels} {hist.total:.6f}")
+            lines.append(f"{name}_count{labels} {hist.count}")
+
+    def render(self, gauges: List[tuple]) -> str:
+        """Prometheus text exposition; gauges are (name, type, help, value) read at scrape time."""
+        lines: List[str] = []
+        with self._lock:
+            self._render_histograms(lines, "vk_http_request_duration_seconds",
+                                    "Request latency by route and status.", self._requests)
+            self._render_histograms(lines, "vk_http_request_db_seconds",
+                                    "Database time spent per request by route and status.", self._request_db)
+            statements = sorted(self._statements.items())
+        lines += ["# HELP vk_db_statement_seconds_total Time spent executing and fetching each SQL statement.",
+                  "# TYPE vk_db_statement_seconds_total counter"]
+        lines += [f"vk_db_statement_seconds_total{self._labels_text(statement=label)} {total:.6f}"
+                  for label, (_, total) in statements]
+        lines += ["# HELP vk_db_statement_calls_total Executions of each SQL statement.",
+                  "# TYPE vk_db_statement_calls_total counter"]
+        lines += [f"vk_db_statement_calls_total{self._labels_text(statement=label)} {count}"
+                  for label, (count, _) in statements]
+        for name, kind, help_text, value in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+metrics = RequestMetrics(METRICS_ENABLED, METRICS_MAX_STATEMENTS)
+
+class _TimedCursor:
+    """Cursor proxy that charges execute and fetch time to the statement that produced it."""
+    __slots__ = ("_cursor", "_sql")
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._sql = ""
+
+    def _timed(self, fn, calls, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            metrics.observe_statement(self._sql, time.perf_counter() - started, calls)
+
+    def execute(self, sql, *args):
+        self._sql = sql
+        return self._timed(self._cursor.execute, 1, sql, *args)
+
+    def executemany(self, sql, *args):
+        self._sql = sql
+        return self._timed(self._cursor.executemany, 1, sql, *args)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone, 0)
+
+    def fetchmany(self, *args):
+        return self._timed(self._cursor.fetchmany, 0, *args)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall, 0)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _TimedConnection:
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
 # ===============================================================
 # DATABASE HANDLER
 # ===============================================================
 
-def get_db():
-    if DATABASE_URL:
-        return psycopg2.connect(DATABASE_URL)
-    return sqlite3.connect(DB_FILE)
+def utc_timestamp() -> str:
+    return format_timestamp(datetime.utcnow())
 
-def init_db():
-    conn = get_db()
-    c = conn.cursor()
+def utc_naive(moment: datetime) -> datetime:
+    """moment as naive UTC, the form every stored timestamp and rollup bucket uses; naive values pass through."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def format_timestamp(moment: datetime) -> str:
+    """Stored timestamp text for moment, read as UTC (aware values are converted)."""
+    moment = utc_naive(moment)
+    # Fixed width (str() drops ".000000"), so lexical order is chronological order
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+class PoolTimeoutError(RuntimeError):
+    pass
+
+_pending_effects: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("pending_effects", default=None)
 
+def after_commit(fn, *args):
+    """Run fn(*args) once the current transaction commits, or right away outside one.
+
+    Effects queued by a transaction that rolls back are dropped. They run after
+    the connection is released, so they never hold a write lock.
+    """
+    pending = _pending_effects.get()
+    if pending is None:
+        fn(*args)
+    else:
+        pending.append((fn, args))
+
+@contextmanager
+def transaction_effects():
+    """Collect after_commit() calls for the enclosed unit of work; nested scopes join the outermost."""
+    if _pending_effects.get() is not None:
+        yield
+        return
+    pending: list = []
+    token = _pending_effects.set(pending)
+    try:
+        yield
+    finally:
+        # Sync generator dependencies (get_db) can exit in a different context than they entered
+        if _pending_effects.get() is pending:
+            _pending_effects.reset(token)
+    for fn, args in pending:
+        fn(*args)
+
+class _PooledConnection:
+    __slots__ = ("raw", "created_at", "last_used")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+class ConnectionPool:
+    """Bounded pool shared by both backends.
+
+    SQLite connections run in WAL mode and stick to the thread that last used
+    them; Postgres connections are handed out LIFO so the warmest one is reused.
+    Idle connections are pinged before reuse and recycled once they get old.
+    """
+
+    def __init__(self, size: int, timeout: float, recycle: float, ping_interval: float, dsn: str):
+        self.dsn = dsn
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle: List[_PooledConnection] = []
+        self._local = threading.local()
+        self._in_use = 0
+        self._opened = 0
+        self._recycled = 0
+        self._failed_pings = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.dsn.startswith(("postgres://", "postgresql://"))
+
+    def _connect(self):
+        # Drivers are imported on first connect, so a worker only ever loads the backend it uses
+        if self.is_postgres:
+            import psycopg2
+            return psycopg2.connect(self.dsn)
+        import sqlite3
+        conn = sqlite3.connect(self.dsn, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        now = time.monotonic()
+        if now - pooled.created_at > self.recycle:
+            self._recycled += 1
+            return False
+        if getattr(pooled.raw, "closed", 0):
+            return False
+        if now - pooled.last_used > self.ping_interval:
+            try:
+                cur = pooled.raw.cursor()
+                cur.execute("SELECT 1")
+                cur.fetchone()
+                pooled.raw.rollback()
+            except Exception:
+                self._failed_pings += 1
+                return False
+        return True
+
+    def _close_quietly(self, pooled: _PooledConnection):
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass
+
+    def acquire(self) -> _PooledConnection:
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"No database connection available within {self.timeout}s")
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._waits += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._in_use += 1
+            pooled = getattr(self._local, "conn", None)
+            if pooled is not None and pooled in self._idle:
+                self._idle.remove(pooled)
+            elif self._idle:
+                pooled = self._idle.pop()
+            else:
+                pooled = None
+
+        try:
+            if pooled is not None and not self._is_healthy(pooled):
+                self._close_quietly(pooled)
+                pooled = None
+            if pooled is None:
+                pooled = _PooledConnection(self._connect())
+                with self._lock:
+                    self._opened += 1
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+            raise
+
+        self._local.conn = pooled
+        return pooled
+
+    def release(self, pooled: _PooledConnection, discard: bool = False):
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            self._in_use -= 1
+            if not discard:
+                self._idle.append(pooled)
+        if discard:
+            self._close_quietly(pooled)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """One connection, one transaction: commit on success, roll back on error."""
+        with transaction_effects():
+            pooled = self.acquire()
+            discard = False
+            try:
+                yield _TimedConnection(pooled.raw) if metrics.enabled else pooled.raw
+                pooled.raw.commit()
+            except BaseException:
+                try:
+                    pooled.raw.rollback()
+                except Exception:
+                    discard = True
+                raise
+            finally:
+                self.release(pooled, discard=discard)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "opened": self._opened,
+                "recycled": self._recycled,
+                "failed_pings": self._failed_pings,
+                "waits": self._waits,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_max": round(self._wait_max, 6),
+                "timeouts": self._timeouts,
+            }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+db_pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PING_INTERVAL,
+                         DATABASE_URL or DB_FILE)
+
+# ===============================================================
+# TENANT SHARDS
+# ===============================================================
+# The home database (DB_FILE / DATABASE_URL) keeps the platform-wide tables:
+# users, services, NBFC partners and the audit log. A tenant's operational
+# data - requests, ledger, wallets, loans, analytics, idempotency keys - lives
+# on its shard, which carries the full schema plus a copy of the tenant's user
+# rows (without password hashes) so shard-local joins keep working. Shards
+# must use the same backend as the home database. With neither SHARD_MAP nor
+# SHARD_DIR set, every tenant lives on the home database.
+
+TENANT_CODE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+SHARD_FILE = re.compile(r"^vyaparkendra_([A-Za-z0-9_-]{1,32})\.db$")
+
+class TenantRouter:
+    """Resolves a tenant to the pool of its shard, and fans reads out across all of them.
+
+    Shard pools are opened (and migrated) on first use. Under SHARD_DIR only
+    mapped tenants, allowlisted tenants and tenants whose shard file already
+    exists are routed; anything else is a 400, so a request can never make
+    the router create a database for a tenant nobody configured. close()
+    drops the pools and the fan-out executor; both are reopened on next use.
+    """
+
+    def __init__(self, home: ConnectionPool, shard_map: dict, shard_dir: Optional[str], tenants: set,
+                 fanout_workers: int):
+        self.home = home
+        self.shard_map = shard_map
+        self.shard_dir = shard_dir
+        self.tenants = tenants
+        self.fanout_workers = fanout_workers
+        self._lock = threading.Lock()
+        self._pools: dict = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.shard_map or self.shard_dir)
+
+    def dsn(self, tenant: str, create: bool = False) -> Optional[str]:
+        """Where the tenant's shard lives; None (also for an empty tenant) means the home database.
+
+        create=True lets an operator command (split-shards) place a tenant that is not allowlisted yet.
+        """
+        if not tenant:
+            return None
+        if tenant in self.shard_map:
+            return self.shard_map[tenant]
+        if self.shard_dir is None or DATABASE_URL:
+            return None
+        if not TENANT_CODE.match(tenant):
+            raise HTTPException(status_code=400, detail="Invalid tenant")
+        path = os.path.join(self.shard_dir, f"vyaparkendra_{tenant}.db")
+        if not (create or tenant in self.tenants or os.path.exists(path)):
+            raise HTTPException(status_code=400, detail="Unknown tenant")
+        return path
+
+    def pool(self, tenant: str, create: bool = False) -> ConnectionPool:
+        dsn = self.dsn(tenant, create)
+        if dsn is None or dsn == self.home.dsn:
+            return self.home
+        pool = self._pools.get(dsn)
+        if pool is not None:
+            return pool
+        with self._lock:
+            if dsn not in self._pools:
+                if self.shard_dir and dsn.startswith(self.shard_dir):
+                    os.makedirs(self.shard_dir, exist_ok=True)
+                pool = ConnectionPool(SHARD_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PING_INTERVAL, dsn)
+                migrate(pool)
+                self._pools[dsn] = pool
+            return self._pools[dsn]
+
+    def is_home(self, tenant: str) -> bool:
+        return self.pool(tenant) is self.home
+
+    def home_conn(self, tenant: str, conn):
+        """conn when the tenant lives on the home database, else None (for home-only reads like the catalog)."""
+        return conn if self.is_home(tenant) else None
+
+    @contextmanager
+    def connection(self, tenant: str, home_conn=None):
+        """One transaction on the tenant's shard; reuses home_conn if that is where the tenant lives,
+        so a handler already holding a home connection never waits on a second slot of the same pool."""
+        pool = self.pool(tenant)
+        if pool is self.home and home_conn is not None:
+            yield home_conn
+            return
+        with pool.connection() as conn:
+            yield conn
+
+    def shards(self) -> List[tuple]:
+        """(tenant, pool) for every tenant off the home database: mapped ones plus shard files in SHARD_DIR."""
+        found = set(self.shard_map)
+        if self.shard_dir and not DATABASE_URL and os.path.isdir(self.shard_dir):
+            found.update(m.group(1) for m in map(SHARD_FILE.match, os.listdir(self.shard_dir)) if m)
+        shards = [(tenant, self.pool(tenant)) for tenant in sorted(found)]
+        return [(tenant, pool) for tenant, pool in shards if pool is not self.home]
+
+    def pools(self) -> List[ConnectionPool]:
+        """The home database and every distinct shard, home first."""
+        pools = [self.home]
+        for _, pool in self.shards():
+            if all(pool is not p for p in pools):
+                pools.append(pool)
+        return pools
+
+    @staticmethod
+    def _unit(pool: ConnectionPool, fn, args):
+        with pool.connection() as conn:
+            return fn(*args, conn=conn)
+
+    def fan_out(self, fn, *args) -> list:
+        """fn(*args, conn=...) on every shard in parallel, one transaction each; results in pools() order."""
+        pools = self.pools()
+        if len(pools) == 1:
+            return [self._unit(pools[0], fn, args)]
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.fanout_workers, thread_name_prefix="shard")
+            executor = self._executor
+        futures = [executor.submit(contextvars.copy_context().run, self._unit, pool, fn, args)
+                   for pool in pools]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = dict(self._pools)
+        return {dsn: pool.stats() for dsn, pool in pools.items()}
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pools, self._pools = self._pools, {}
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for pool in pools.values():
+            pool.close()
+
+def load_shard_map(value: str) -> dict:
+    if not value:
+        return {}
+    if not value.lstrip().startswith("{"):
+        with open(value) as f:
+            value = f.read()
+    return json.loads(value)
+
+tenant_router = TenantRouter(db_pool, load_shard_map(SHARD_MAP), SHARD_DIR,
+                             {t.strip() for t in SHARD_TENANTS.split(",") if t.strip()}, SHARD_FANOUT_WORKERS)
+
+SHARD_USER_INSERT = "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING"
+
+def get_db():
+    """Request-scoped dependency: one pooled connection and one transaction per HTTP request."""
+    try:
+        with db_pool.connection() as conn:
+            yield conn
+    except PoolTimeoutError:
+        raise HTTPException(status_code=503, detail="Database busy, please retry")
+
+# Commit when the handler returns, before the response is sent to the client
+DBSession = Depends(get_db, scope="function")
+
+class AsyncDatabase:
+    """Awaitable access to the pool for async handlers.
+
+    Units of work run on a dedicated executor sized to the pool, so the event
+    loop never blocks on a driver call and DB waits do not eat into the shared
+    threadpool that sync dependencies and handlers rely on. The executor is
+    created on first use, so a close() at shutdown does not break a later
+    startup in the same process.
+    """
+
+    def __init__(self, pool: ConnectionPool, workers: int):
+        self._pool = pool
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        executor = self._executor
+        if executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="db")
+                executor = self._executor
+        return executor
+
+    def _unit(self, pool, fn, args, kwargs):
+        with pool.connection() as conn:
+            return fn(*args, conn=conn, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, conn=<pooled connection>) as one transaction."""
+        return await self.run_on(self._pool, fn, *args, **kwargs)
+
+    async def run_on(self, pool: ConnectionPool, fn, *args, **kwargs):
+        """run() against another pool, e.g. a tenant shard."""
+        loop = asyncio.get_running_loop()
+        # run_in_executor drops contextvars; carry them so DB time lands on this request
+        ctx = contextvars.copy_context()
+        try:
+            return await loop.run_in_executor(self._get_executor(), ctx.run, self._unit, pool, fn, args, kwargs)
+        except PoolTimeoutError:
+            raise HTTPException(status_code=503, detail="Database busy, please retry")
+
+    async def call(self, fn, *args):
+        """Await a blocking callable that manages its own connection."""
+        ctx = contextvars.copy_context()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), ctx.run, fn, *args)
+        except PoolTimeoutError:
+            raise HTTPException(status_code=503, detail="Database busy, please retry")
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+adb = AsyncDatabase(db_pool, DB_POOL_SIZE)
+
+def db_endpoint(fn):
+    """Serve a handler written against `conn=DBSession` (or `TenantSession`) through the async path.
+
+    The returned coroutine drops `conn` from the signature FastAPI sees and
+    awaits the original body as one unit of work on the DB executor, against
+    the caller's shard for TenantSession. With DB_ASYNC=0 the handler stays a
+    plain sync route that commits its session itself, because the session
+    dependency runs in another context and could not run its after_commit effects.
+    """
+    if not DB_ASYNC:
+        @functools.wraps(fn)
+        def sync_endpoint(**kwargs):
+            with transaction_effects():
+                result = fn(**kwargs)
+                kwargs["conn"].commit()
+            return result
+        return sync_endpoint
+    sig = inspect.signature(fn)
+    on_shard = sig.parameters["conn"].default is TenantSession
+
+    @functools.wraps(fn)
+    async def endpoint(**kwargs):
+        pool = tenant_router.pool(kwargs["user"]["tenant"]) if on_shard else db_pool
+        return await adb.run_on(pool, fn, **kwargs)
+
+    endpoint.__signature__ = sig.replace(parameters=[p for p in sig.parameters.values() if p.name != "conn"])
+    del endpoint.__wrapped__  # keep FastAPI from unwrapping back to the sync signature
+    return endpoint
+
+# ===============================================================
+# AUDIT PARTITIONS
+# ===============================================================
+# audit_logs is stored one day per partition. On Postgres that is a native
+# range-partitioned table, read and written through the parent as before. On
+# SQLite each day is its own audit_logs_YYYYMMDD table; writes are routed by
+# the row's timestamp and keyset reads walk the partitions newest first, so a
+# page only touches the days it needs. Days past AUDIT_RETENTION_DAYS are
+# rolled into compressed NDJSON files under AUDIT_ARCHIVE_DIR and dropped.
+
+AUDIT_DAY = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+AUDIT_COLUMNS = "id TEXT, user_id TEXT, role TEXT, action TEXT, ip_address TEXT, timestamp TEXT"
+
+class AuditPartitions:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known: set = set()
+
+    @staticmethod
+    def table(day: str) -> str:
+        if not AUDIT_DAY.match(day):
+            raise ValueError(f"Not a partition day: {day}")
+        return "audit_logs_" + day.replace("-", "")
+
+    @staticmethod
+    def day_of(table: str) -> str:
+        digits = table[len("audit_logs_"):]
+        return f"{digits[:4]}-{digits[4:6]}-{digits[6:]}"
+
+    def create(self, c, day: str) -> str:
+        table = self.table(day)
+        if DATABASE_URL:
+            upper = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            c.execute(f"CREATE TABLE IF NOT EXISTS {table} PARTITION OF audit_logs FOR VALUES FROM (?) TO (?)",
+                      (day, upper))
+        else:
+            c.execute(f"CREATE TABLE IF NOT EXISTS {table}({AUDIT_COLUMNS}, PRIMARY KEY (timestamp, id))")
+            c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table}(user_id, timestamp, id)")
+        with self._lock:
+            self._known.add(day)
+        return table
+
+    def insert(self, conn, rows: List[tuple]):
+        """Write audit rows, creating any day partition this process has not seen yet."""
+        by_day: dict = {}
+        for row in rows:
+            by_day.setdefault(row[5][:10], []).append(row)
+        c = conn.cursor()
+        for day, day_rows in by_day.items():
+            if day not in self._known:
+                self.create(c, day)
+            target = "audit_logs" if DATABASE_URL else self.table(day)
+            c.executemany(f"INSERT INTO {target} VALUES (?, ?, ?, ?, ?, ?)", day_rows)
+
+    def list(self, c) -> List[str]:
+        """Partition days, newest first."""
+        if DATABASE_URL:
+            c.execute("""SELECT child.relname FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                WHERE parent.relname = 'audit_logs'""")
+        else:
+            c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name GLOB 'audit_logs_[0-9]*'")
+        return sorted((self.day_of(row[0]) for row in c.fetchall()), reverse=True)
+
+    def drop(self, c, day: str):
+        c.execute(f"DROP TABLE IF EXISTS {self.table(day)}")
+        with self._lock:
+            self._known.discard(day)
+
+    def queries(self, c, template: str, filters: List[str], params: list, keys: tuple,
+                cursor: Optional[str]) -> List[tuple]:
+        """Keyset queries for `template` (with an {audit} placeholder), in page order.
+
+        Postgres gets one query on the parent and prunes partitions itself; on
+        SQLite there is one query per day partition at or before the cursor.
+        """
+        if DATABASE_URL:
+            return [keyset_query(template.format(audit="audit_logs"), filters, params, keys, cursor)]
+        days = self.list(c)
+        if cursor:
+            # decode_cursor has already rejected non-timestamp keys; the day prefix must still name a partition
+            newest = decode_cursor(cursor)[0][:10]
+            if not AUDIT_DAY.match(newest):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            days = [day for day in days if day <= newest]
+        return [keyset_query(template.format(audit=self.table(day)), filters, params, keys, cursor) for day in days]
+
+audit_partitions = AuditPartitions()
+
+def _m001_base_tables(c):
     c.execute("""CREATE TABLE IF NOT EXISTS users(
         id TEXT PRIMARY KEY,
         name TEXT,
@@ -128,59 +940,1862 @@ def init_db():
         updated_at TEXT
     )""")
 
-    conn.commit()
-    conn.close()
+def _m002_hot_path_indexes(c):
+    for stmt in (
+        "CREATE INDEX IF NOT EXISTS idx_ledger_mitra_type ON ledger(mitra_id, type, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_ledger_type ON ledger(type, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_loans_mitra ON loan_applications(mitra_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_loans_status ON loan_applications(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_services_tenant ON services(tenant)",
+        "CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)",
+        "CREATE INDEX IF NOT EXISTS idx_users_tenant ON users(tenant, id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_ts ON audit_logs(timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_user_ts ON audit_logs(user_id, timestamp)",
+    ):
+        c.execute(stmt)
+
+def _m003_wallet_balances(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS wallet_balances(
+        mitra_id TEXT PRIMARY KEY,
+        credits REAL,
+        debits REAL,
+        updated_at TEXT
+    )""")
+    c.execute("""INSERT INTO wallet_balances
+        SELECT mitra_id,
+               COALESCE(SUM(CASE WHEN type='credit' THEN amount END), 0),
+               COALESCE(SUM(CASE WHEN type='debit' THEN amount END), 0),
+               ?
+        FROM ledger GROUP BY mitra_id""", (utc_timestamp(),))
+
+def _m004_platform_counters(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS platform_counters(
+        name TEXT PRIMARY KEY,
+        value REAL
+    )""")
+    c.execute("INSERT INTO platform_counters SELECT 'total_mitras', COUNT(*) FROM users WHERE role='mitra'")
+    c.execute("INSERT INTO platform_counters SELECT 'total_requests', COUNT(*) FROM service_requests")
+    c.execute("INSERT INTO platform_counters SELECT 'total_revenue', COALESCE(SUM(amount), 0) FROM ledger WHERE type='credit'")
+    c.execute("INSERT INTO platform_counters VALUES ('version', 0)")
+
+def _m005_keyset_indexes(c):
+    # Keyset pages order by (created_at, id) / (timestamp, id); index the tie-breaker too
+    for stmt in (
+        "DROP INDEX IF EXISTS idx_loans_mitra",
+        "DROP INDEX IF EXISTS idx_loans_status",
+        "DROP INDEX IF EXISTS idx_audit_user_ts",
+        "CREATE INDEX IF NOT EXISTS idx_loans_mitra_keyset ON loan_applications(mitra_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_loans_status_keyset ON loan_applications(status, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_user_keyset ON audit_logs(user_id, timestamp, id)",
+    ):
+        c.execute(stmt)
+
+def _m006_catalog_version(c):
+    c.execute("INSERT INTO platform_counters VALUES ('catalog_version', 0)")
+
+def _m007_analytics_rollups(c):
+    # dimension is 'tenant' (key ''), 'category' or 'mitra'; bucket is the hour or day prefix of a timestamp
+    c.execute("""CREATE TABLE IF NOT EXISTS analytics_rollups(
+        grain TEXT,
+        tenant TEXT,
+        dimension TEXT,
+        bucket TEXT,
+        key TEXT,
+        requests INTEGER,
+        completed INTEGER,
+        revenue REAL,
+        commission REAL,
+        PRIMARY KEY (grain, tenant, dimension, bucket, key)
+    )""")
 
-init_db()
+def _m008_credit_scoring_indexes(c):
+    # Per-applicant request and loan history for the scoring feature query, and the partner queue
+    for stmt in (
+        "CREATE INDEX IF NOT EXISTS idx_requests_mitra_status ON service_requests(mitra_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_msme_status ON service_requests(msme_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_loans_mitra_status ON loan_applications(mitra_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_loans_partner_status ON loan_applications(nbfc_partner_id, status, created_at)",
+    ):
+        c.execute(stmt)
+
+def _m009_audit_partitions(c):
+    # Audit rows always carry a utc_timestamp(), so every row lands in a day partition
+    c.execute("SELECT DISTINCT substr(timestamp, 1, 10) FROM audit_logs WHERE timestamp IS NOT NULL")
+    days = sorted(row[0] for row in c.fetchall())
+    if DATABASE_URL:
+        c.execute("ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned")
+        c.execute(f"CREATE TABLE audit_logs({AUDIT_COLUMNS}, PRIMARY KEY (timestamp, id)) PARTITION BY RANGE (timestamp)")
+        for day in days:
+            audit_partitions.create(c, day)
+        c.execute("INSERT INTO audit_logs SELECT * FROM audit_logs_unpartitioned")
+        c.execute("DROP TABLE audit_logs_unpartitioned")
+        c.execute("CREATE INDEX idx_audit_user_keyset ON audit_logs(user_id, timestamp, id)")
+        return
+    for day in days:
+        table = audit_partitions.create(c, day)
+        c.execute(f"INSERT INTO {table} SELECT * FROM audit_logs WHERE substr(timestamp, 1, 10) = ?", (day,))
+    c.execute("DROP TABLE audit_logs")
+
+def _m010_idempotency_keys(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS idempotency_keys(
+        user_id TEXT,
+        key TEXT,
+        fingerprint TEXT,
+        status_code INTEGER,
+        response TEXT,
+        created_at TEXT,
+        expires_at TEXT,
+        PRIMARY KEY (user_id, key)
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_expiry ON idempotency_keys(expires_at)")
+
+def _m011_partner_queue_index(c):
+    # Without id the partner index cannot serve ORDER BY created_at, id and loses to idx_loans_status_keyset
+    c.execute("DROP INDEX IF EXISTS idx_loans_partner_status")
+    c.execute("CREATE INDEX idx_loans_partner_status ON loan_applications(nbfc_partner_id, status, created_at, id)")
+
+def _m012_idempotency_media_type(c):
+    # Replays return the stored body verbatim, so they need the original media type alongside it
+    c.execute("ALTER TABLE idempotency_keys ADD COLUMN media_type TEXT")
+
+# Append-only: (version, name, fn). Never edit a migration once it has shipped.
+MIGRATIONS = [
+    (1, "base tables", _m001_base_tables),
+    (2, "hot path indexes", _m002_hot_path_indexes),
+    (3, "wallet balances", _m003_wallet_balances),
+    (4, "platform counters", _m004_platform_counters),
+    (5, "keyset pagination indexes", _m005_keyset_indexes),
+    (6, "catalog version stamp", _m006_catalog_version),
+    (7, "analytics rollups", _m007_analytics_rollups),
+    (8, "credit scoring indexes", _m008_credit_scoring_indexes),
+    (9, "daily audit log partitions", _m009_audit_partitions),
+    (10, "idempotency keys", _m010_idempotency_keys),
+    (11, "partner queue index in keyset order", _m011_partner_queue_index),
+    (12, "idempotency response media type", _m012_idempotency_media_type),
+]
+
+def run_migrations(conn) -> List[int]:
+    c = conn.cursor()
+    c.execute("""CREATE TABLE IF NOT EXISTS schema_migrations(
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TEXT
+    )""")
+    c.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in c.fetchall()}
+    done = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        migrate(c)
+        c.execute("INSERT INTO schema_migrations VALUES (?, ?, ?)", (version, name, utc_timestamp()))
+        conn.commit()
+        done.append(version)
+    return done
+
+MIGRATION_LOCK_KEY = 0x564B4D47  # pg_advisory_lock key shared by every process migrating one database
+
+def schema_is_current(conn) -> bool:
+    c = conn.cursor()
+    try:
+        c.execute("SELECT MAX(version) FROM schema_migrations")
+        return c.fetchone()[0] == MIGRATIONS[-1][0]
+    except Exception:
+        # No schema_migrations yet; Postgres also needs the failed statement rolled back
+        conn.rollback()
+        return False
+
+@contextmanager
+def migration_lock(pool: ConnectionPool, conn):
+    """Hold the database's migration lock: a session advisory lock on Postgres, an
+    exclusive flock on <database>.migrate.lock for SQLite (no-op where fcntl is missing)."""
+    if pool.is_postgres:
+        c = conn.cursor()
+        c.execute(f"SELECT pg_advisory_lock({MIGRATION_LOCK_KEY})")
+        try:
+            yield
+        finally:
+            c.execute(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_KEY})")
+        return
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(pool.dsn + ".migrate.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def migrate(pool: ConnectionPool) -> List[int]:
+    """Bring pool's database up to date, whichever of N starting workers gets there first.
+
+    An up-to-date schema costs one query and no lock. Otherwise the first
+    worker to take the lock applies the pending migrations and the rest, once
+    they get the lock, find nothing left to do.
+    """
+    with pool.connection() as conn:
+        if schema_is_current(conn):
+            return []
+        with migration_lock(pool, conn):
+            return run_migrations(conn)
+
+def init_db() -> List[int]:
+    return migrate(db_pool)
 
 # ===============================================================
 # UTILITIES & SECURITY
 # ===============================================================
 
+class PasswordHasher:
+    """Salted KDF hashing on a dedicated, bounded worker pool.
+
+    Stored formats (users.password_hash):
+        scrypt$<n>$<r>$<p>$<salt>$<hash>
+        pbkdf2_sha256$<iterations>$<salt>$<hash>
+        <64 hex chars>  legacy unsalted SHA-256, rehashed on next login
+    hashlib's KDFs release the GIL, so threads give real parallelism here and
+    the pool size caps how many cores login/register can take. Work beyond
+    max_pending is shed with a 503 instead of queueing without bound. The
+    pool is created on first use, so it comes back after close().
+    """
+
+    def __init__(self, algorithm: str, workers: int, max_pending: int):
+        if algorithm not in ("scrypt", "pbkdf2_sha256"):
+            raise ValueError(f"Unknown password KDF: {algorithm}")
+        self.algorithm = algorithm
+        self.max_pending = max_pending
+        self._workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._dummy_hash: Optional[str] = None
+
+    def _params(self) -> str:
+        if self.algorithm == "scrypt":
+            return f"scrypt${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}"
+        return f"pbkdf2_sha256${PASSWORD_PBKDF2_ITERATIONS}"
+
+    @staticmethod
+    def _derive(password: str, params: List[str], salt: bytes) -> bytes:
+        if params[0] == "scrypt":
+            n, r, p = int(params[1]), int(params[2]), int(params[3])
+            return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                                  maxmem=256 * n * r * p, dklen=32)
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, int(params[1]))
+
+    def hash_sync(self, password: str) -> str:
+        params = self._params()
+        salt = os.urandom(16)
+        derived = self._derive(password, params.split("$"), salt)
+        return "$".join([params, base64.b64encode(salt).decode(), base64.b64encode(derived).decode()])
+
+    def verify_sync(self, password: str, stored: Optional[str]) -> bool:
+        if stored is None:
+            # Unknown user: burn the same KDF time so response timing does not leak it
+            if self._dummy_hash is None:
+                self._dummy_hash = self.hash_sync(os.urandom(8).hex())
+            self.verify_sync(password, self._dummy_hash)
+            return False
+        if "$" not in stored:
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(legacy, stored)
+        *params, salt, expected = stored.split("$")
+        derived = self._derive(password, params, base64.b64decode(salt))
+        return hmac.compare_digest(derived, base64.b64decode(expected))
+
+    def needs_rehash(self, stored: str) -> bool:
+        return stored.rsplit("$", 2)[0] != self._params()
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(status_code=503, detail="Authentication busy, please retry",
+                                    headers={"Retry-After": "1"})
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="kdf")
+            executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.hash_sync, password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> bool:
+        return await self._submit(self.verify_sync, password, stored)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+password_hasher = PasswordHasher(PASSWORD_KDF, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
 def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+    return password_hasher.hash_sync(password)
+
+def _read_key(env_name: str, path: str) -> Optional[str]:
+    # Same lookup as server.ts: PEM from the environment, else the file next to the app
+    if os.getenv(env_name):
+        return os.getenv(env_name)
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read()
+    return None
+
+if ALGORITHM.startswith(("RS", "ES", "PS")):
+    from jwt.algorithms import has_crypto
+    # Fail at startup, not with a 500 on every login
+    if not has_crypto:
+        raise RuntimeError(f"JWT_ALGORITHM={ALGORITHM} needs the cryptography package: pip install 'pyjwt[crypto]'")
+    SIGNING_KEY = _read_key("PRIVATE_KEY", JWT_PRIVATE_KEY_FILE)  # None on verify-only edge nodes
+    VERIFYING_KEY = _read_key("PUBLIC_KEY", JWT_PUBLIC_KEY_FILE)
+else:
+    SIGNING_KEY = VERIFYING_KEY = SECRET_KEY
 
 def create_token(data: dict) -> str:
+    if SIGNING_KEY is None:
+        raise HTTPException(status_code=503, detail="This node cannot issue tokens")
     data.update({"exp": datetime.utcnow() + timedelta(hours=24)})
-    return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
-
-def get_current_user(token: str = Depends(oauth2_scheme)):
+    return jwt.encode(data, SIGNING_KEY, algorithm=ALGORITHM)
+
+class TokenClaimsCache:
+    """Bounded LRU of verified claims keyed by token digest, valid until the token's exp.
+
+    Revocation is checked on every lookup, cached or not: revoke() covers a
+    single token in this worker until it expires, and hooks registered with add_revocation_hook
+    can consult a shared store (e.g. a denylist table) by claims.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._revoked: OrderedDict = OrderedDict()
+        self._hooks: List[Callable[[dict], bool]] = []
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def verify(self, token: str) -> dict:
+        key = self.digest(token)
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if claims is None:
+            claims = jwt.decode(token, VERIFYING_KEY, algorithms=[ALGORITHM])
+            with self._lock:
+                self.misses += 1
+                if self.maxsize > 0:
+                    self._entries[key] = claims
+                    if len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+        elif claims.get("exp", 0) <= time.time():
+            with self._lock:
+                self._entries.pop(key, None)
+            raise jwt.ExpiredSignatureError("Signature has expired")
+        if key in self._revoked or any(hook(claims) for hook in self._hooks):
+            raise jwt.InvalidTokenError("Token revoked")
+        return claims
+
+    def revoke(self, token: str, exp: Optional[float] = None):
+        """Deny the token until exp (its claims' exp; None keeps it for the life of the worker)."""
+        key = self.digest(token)
+        now = time.time()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._revoked[key] = float("inf") if exp is None else exp
+            # Only expired revocations are forgotten; jwt.decode rejects those tokens on its own
+            while self._revoked:
+                oldest, until = next(iter(self._revoked.items()))
+                if until > now:
+                    break
+                del self._revoked[oldest]
+
+    def add_revocation_hook(self, hook: Callable[[dict], bool]):
+        self._hooks.append(hook)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "capacity": self.maxsize,
+                    "hits": self.hits, "misses": self.misses, "revoked": len(self._revoked)}
+
+token_cache = TokenClaimsCache(JWT_CACHE_SIZE)
+
+# async: pure CPU on a cache hit, so skip the threadpool hop a sync dependency costs
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        return token_cache.verify(token)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def require_role(allowed_roles: List[str]):
-    def role_checker(user: dict = Depends(get_current_user)):
-        if user.get("role") not in allowed_roles:
+    allowed = frozenset(allowed_roles)
+    async def role_checker(user: dict = Depends(get_current_user)):
+        if user.get("role") not in allowed:
             raise HTTPException(status_code=403, detail="Insufficient permissions")
         return user
     return role_checker
 
+def get_tenant_db(user=Depends(get_current_user)):
+    """get_db on the shard holding the caller's tenant."""
+    try:
+        with tenant_router.pool(user["tenant"]).connection() as conn:
+            yield conn
+    except PoolTimeoutError:
+        raise HTTPException(status_code=503, detail="Database busy, please retry")
+
+# Tenant-scoped handlers take conn=TenantSession instead of DBSession
+TenantSession = Depends(get_tenant_db, scope="function")
+
 def log_audit(user_id: str, role: str, action: str, ip_address: str):
-    conn = get_db()
+    # Queued on commit: rolled-back actions are not audited, and a full queue never blocks a writer mid-transaction
+    after_commit(audit_writer.submit, audit_row(user_id, role, action, ip_address))
+
+STATE_ANALYTICS_UPSERT = """INSERT INTO state_analytics VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(state) DO UPDATE SET
+        total_revenue = state_analytics.total_revenue + excluded.total_revenue,
+        total_requests = state_analytics.total_requests + excluded.total_requests,
+        updated_at = excluded.updated_at"""
+
+def update_state_analytics(conn, state: str, revenue: float = 0, requests: int = 0):
+    if analytics_buffer.enabled:
+        # Staged with the transaction: a rollback must not flush revenue that never happened
+        after_commit(analytics_buffer.add, state, revenue, requests)
+        return
+    conn.cursor().execute(STATE_ANALYTICS_UPSERT,
+                          (str(uuid.uuid4()), state, revenue, requests, utc_timestamp()))
+
+class StateAnalyticsBuffer:
+    """Coalesces counter increments per state and flushes them as one upsert batch.
+
+    Trades a flush interval of lag (and loss of unflushed deltas on a hard
+    crash) for one write per state per interval instead of one per request.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.enabled = flush_interval > 0
+        self._lock = threading.Lock()
+        self._deltas: dict = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, state: str, revenue: float, requests: int):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="analytics-flusher", daemon=True)
+                self._thread.start()
+            pending = self._deltas.get(state, (0, 0))
+            self._deltas[state] = (pending[0] + revenue, pending[1] + requests)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+        if not deltas:
+            return
+        now = utc_timestamp()
+        # Each state's row lives on its own shard: one batch per shard
+        by_pool: dict = {}
+        for state, delta in deltas.items():
+            try:
+                pool = tenant_router.pool(state)
+            except Exception:
+                # Shard unavailable (or a pool timeout while opening it): keep the delta for the next flush
+                self._requeue({state: delta})
+                continue
+            by_pool.setdefault(pool, {})[state] = delta
+        for pool, batch in by_pool.items():
+            try:
+                with pool.connection() as conn:
+                    conn.cursor().executemany(STATE_ANALYTICS_UPSERT, [
+                        (str(uuid.uuid4()), state, revenue, requests, now)
+                        for state, (revenue, requests) in batch.items()
+                    ])
+                    # Move the shard's version stamp too, or AnalyticsCache keeps serving the old state_metrics
+                    bump_counters(conn)
+            except Exception:
+                # Put the deltas back so the next flush retries them
+                self._requeue(batch)
+
+    def _requeue(self, batch: dict):
+        with self._lock:
+            for state, (revenue, requests) in batch.items():
+                pending = self._deltas.get(state, (0, 0))
+                self._deltas[state] = (pending[0] + revenue, pending[1] + requests)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # The next add() starts a fresh flusher, e.g. on a second startup in the same process
+        self._stop.clear()
+        self.flush()
+
+analytics_buffer = StateAnalyticsBuffer(ANALYTICS_FLUSH_INTERVAL)
+
+def bump_counters(conn, **deltas):
+    """Move platform_counters and the version stamp in the caller's transaction."""
     c = conn.cursor()
-    c.execute("INSERT INTO audit_logs VALUES (?, ?, ?, ?, ?, ?)",
-              (str(uuid.uuid4()), user_id, role, action, ip_address, str(datetime.utcnow())))
-    conn.commit()
-    conn.close()
+    for name, delta in list(deltas.items()) + [("version", 1)]:
+        c.execute("UPDATE platform_counters SET value = value + ? WHERE name=?", (delta, name))
+    after_commit(analytics_cache.invalidate)
+
+WALLET_BALANCE_UPSERT = """INSERT INTO wallet_balances VALUES (?, ?, ?, ?)
+    ON CONFLICT(mitra_id) DO UPDATE SET
+        credits = wallet_balances.credits + excluded.credits,
+        debits = wallet_balances.debits + excluded.debits,
+        updated_at = excluded.updated_at"""
+
+def record_ledger_entry(conn, mitra_id: str, amount: float, entry_type: str, reference_id: str) -> str:
+    """Append to the ledger and move wallet_balances in the caller's transaction."""
+    entry_id = str(uuid.uuid4())
+    now = utc_timestamp()
+    credit, debit = (amount, 0) if entry_type == "credit" else (0, amount)
+    c = conn.cursor()
+    c.execute("INSERT INTO ledger VALUES (?, ?, ?, ?, ?, ?)",
+              (entry_id, mitra_id, amount, entry_type, reference_id, now))
+    c.execute(WALLET_BALANCE_UPSERT, (mitra_id, credit, debit, now))
+    return entry_id
 
-def update_state_analytics(state: str, revenue: float = 0, requests: int = 0):
-    conn = get_db()
+def reconcile_wallets(conn, fix: bool = False, tolerance: float = 1e-6) -> List[dict]:
+    """Re-derive every balance from the ledger and report (optionally repair) drift."""
     c = conn.cursor()
-    c.execute("SELECT * FROM state_analytics WHERE state=?", (state,))
-    row = c.fetchone()
-    if row:
-        c.execute("UPDATE state_analytics SET total_revenue = total_revenue + ?, total_requests = total_requests + ?, updated_at = ? WHERE state=?",
-                  (revenue, requests, str(datetime.utcnow()), state))
-    else:
-        c.execute("INSERT INTO state_analytics VALUES (?, ?, ?, ?, ?)",
-                  (str(uuid.uuid4()), state, revenue, requests, str(datetime.utcnow())))
-    conn.commit()
-    conn.close()
+    c.execute("""SELECT mitra_id,
+               COALESCE(SUM(CASE WHEN type='credit' THEN amount END), 0),
+               COALESCE(SUM(CASE WHEN type='debit' THEN amount END), 0)
+        FROM ledger GROUP BY mitra_id""")
+    expected = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+    c.execute("SELECT mitra_id, credits, debits FROM wallet_balances")
+    stored = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+
+    drift = []
+    for mitra_id in expected.keys() | stored.keys():
+        want = expected.get(mitra_id, (0, 0))
+        have = stored.get(mitra_id, (0, 0))
+        if abs(want[0] - have[0]) > tolerance or abs(want[1] - have[1]) > tolerance:
+            drift.append({"mitra_id": mitra_id, "ledger_credits": want[0], "ledger_debits": want[1],
+                          "stored_credits": have[0], "stored_debits": have[1]})
+    if fix:
+        now = utc_timestamp()
+        c.executemany("""INSERT INTO wallet_balances VALUES (?, ?, ?, ?)
+            ON CONFLICT(mitra_id) DO UPDATE SET
+                credits = excluded.credits, debits = excluded.debits, updated_at = excluded.updated_at""",
+                      [(d["mitra_id"], d["ledger_credits"], d["ledger_debits"], now) for d in drift])
+    return drift
+
+# ===============================================================
+# IDEMPOTENCY KEYS
+# ===============================================================
+
+class IdempotencyStore:
+    """Idempotency-Key claims and stored responses, scoped per user, inside the handler's transaction.
+
+    The claim row and the response are written in the same transaction as the
+    work itself, so a key is only ever seen with its final response: a
+    concurrent retry blocks on the claim until the first attempt commits (and
+    then replays it) or rolls back (and then runs for real). Failed attempts
+    leave nothing behind, so a retry after an error re-executes. Expired keys
+    are purged at most once per purge_interval per worker.
+    """
+
+    MAX_KEY_LENGTH = 255
+
+    def __init__(self, ttl: float, purge_interval: float):
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self.replays = 0
+
+    def _maybe_purge(self, c, now: str):
+        if time.monotonic() - self._purged_at < self.purge_interval:
+            return
+        self._purged_at = time.monotonic()
+        c.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
+
+    def claim(self, conn, user_id: str, key: str, fingerprint: str) -> Optional[Response]:
+        """None if this attempt owns the key; otherwise the stored response to replay."""
+        if len(key) > self.MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+        c = conn.cursor()
+        now = utc_timestamp()
+        expires = (datetime.utcnow() + timedelta(seconds=self.ttl)).strftime("%Y-%m-%d %H:%M:%S.%f")
+        self._maybe_purge(c, now)
+        c.execute("""INSERT INTO idempotency_keys (user_id, key, fingerprint, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id, key) DO NOTHING""", (user_id, key, fingerprint, now, expires))
+        if c.rowcount == 1:
+            return None
+        c.execute("""SELECT fingerprint, status_code, response, media_type, expires_at
+            FROM idempotency_keys WHERE user_id=? AND key=?""", (user_id, key))
+        stored_fingerprint, status_code, body, media_type, expires_at = c.fetchone()
+        if expires_at < now:
+            c.execute("""UPDATE idempotency_keys SET fingerprint=?, status_code=NULL, response=NULL, media_type=NULL,
+                created_at=?, expires_at=? WHERE user_id=? AND key=?""", (fingerprint, now, expires, user_id, key))
+            return None
+        if stored_fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        self.replays += 1
+        return Response(content=body, status_code=status_code, media_type=media_type or "application/json",
+                        headers={"Idempotent-Replayed": "true"})
+
+    def save(self, conn, user_id: str, key: str, response: Response):
+        """Store the rendered body and media type exactly as sent, so a replay is byte-identical."""
+        conn.cursor().execute("""UPDATE idempotency_keys SET status_code=?, response=?, media_type=?
+            WHERE user_id=? AND key=?""",
+            (response.status_code, response.body.decode(response.charset), response.media_type, user_id, key))
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_TTL, IDEMPOTENCY_PURGE_INTERVAL)
+
+def idempotent(fn):
+    """Honour an Idempotency-Key header on a handler written against `request`, `user` and `conn`.
+
+    The fingerprint covers method, path and body, so reusing a key for a
+    different request is rejected instead of replaying the wrong response.
+    """
+    @functools.wraps(fn)
+    def handler(**kwargs):
+        request, user, conn = kwargs["request"], kwargs["user"], kwargs["conn"]
+        key = request.headers.get("idempotency-key")
+        if not key:
+            return fn(**kwargs)
+        body = {k: v.model_dump() if isinstance(v, BaseModel) else v
+                for k, v in kwargs.items() if k not in ("request", "user", "conn")}
+        fingerprint = hashlib.sha256(f"{request.method} {request.url.path} {json.dumps(body, sort_keys=True, default=str)}"
+                                     .encode()).hexdigest()
+        replay = idempotency_store.claim(conn, user["user_id"], key, fingerprint)
+        if replay is not None:
+            return replay
+        result = fn(**kwargs)
+        # Render once here so the stored bytes are the ones this attempt actually sends
+        response = result if isinstance(result, Response) else FastJSONResponse(result)
+        idempotency_store.save(conn, user["user_id"], key, response)
+        return response
+    return handler
+
+# ===============================================================
+# TIME-BUCKETED ROLLUPS
+# ===============================================================
+# analytics_rollups holds additive counters per (grain, tenant, dimension,
+# bucket, key). Buckets are timestamp prefixes ("2026-03-01 14" for the hour,
+# "2026-03-01" for the day), so they sort and range-scan as plain strings.
+# Write paths upsert their deltas in the caller's transaction; range queries
+# read daily buckets for whole days and hourly buckets only for the edges.
+
+ROLLUP_GRAINS = (("hour", 13), ("day", 10))
+ROLLUP_DIMENSIONS = ("tenant", "category", "mitra")
+
+ROLLUP_UPSERT = """INSERT INTO analytics_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(grain, tenant, dimension, bucket, key) DO UPDATE SET
+        requests = analytics_rollups.requests + excluded.requests,
+        completed = analytics_rollups.completed + excluded.completed,
+        revenue = analytics_rollups.revenue + excluded.revenue,
+        commission = analytics_rollups.commission + excluded.commission"""
+
+def rollup_deltas(tenant: str, timestamp: str, category: Optional[str], mitra_id: str,
+                  requests: int = 0, completed: int = 0, revenue: float = 0, commission: float = 0):
+    """The six (grain x dimension) rows one event contributes to."""
+    keys = ("", category or "unknown", mitra_id)
+    for grain, width in ROLLUP_GRAINS:
+        bucket = timestamp[:width]
+        for dimension, key in zip(ROLLUP_DIMENSIONS, keys):
+            yield (grain, tenant, dimension, bucket, key, requests, completed, revenue, commission)
+
+def coalesce_rollups(deltas, into: Optional[dict] = None) -> dict:
+    """Sum deltas sharing a bucket key, so a batch costs one upsert per bucket."""
+    merged = {} if into is None else into
+    for row in deltas:
+        key = row[:5]
+        pending = merged.get(key)
+        merged[key] = row[5:] if pending is None else tuple(a + b for a, b in zip(pending, row[5:]))
+    return merged
+
+def update_rollups(conn, deltas):
+    conn.cursor().executemany(ROLLUP_UPSERT, [key + values for key, values in coalesce_rollups(deltas).items()])
+
+def rollup_ranges(start: datetime, end: datetime) -> List[tuple]:
+    """Cover [start, end) at hour resolution with as few buckets as possible.
+
+    Whole days come from the day grain; the leading and trailing partial days
+    from the hour grain. Returns (grain, first bucket, bucket after the last).
+    """
+    hour = lambda t: t.strftime("%Y-%m-%d %H")
+    day = lambda t: t.strftime("%Y-%m-%d")
+    start = utc_naive(start).replace(minute=0, second=0, microsecond=0)
+    end = utc_naive(end).replace(minute=0, second=0, microsecond=0)
+    if end <= start:
+        return []
+    first_day = start if start.hour == 0 else start.replace(hour=0) + timedelta(days=1)
+    last_day = end.replace(hour=0)
+    if first_day >= last_day:
+        return [("hour", hour(start), hour(end))]
+    ranges = []
+    if start < first_day:
+        ranges.append(("hour", hour(start), hour(first_day)))
+    ranges.append(("day", day(first_day), day(last_day)))
+    if last_day < end:
+        ranges.append(("hour", hour(last_day), hour(end)))
+    return ranges
+
+def query_rollups(conn, tenant: str, start: datetime, end: datetime, dimension: str = "tenant",
+                  key: Optional[str] = None) -> dict:
+    """Totals per dimension key over [start, end), reading only the covering buckets."""
+    c = conn.cursor()
+    totals: dict = {}
+    for grain, lo, hi in rollup_ranges(start, end):
+        sql = """SELECT key, SUM(requests), SUM(completed), SUM(revenue), SUM(commission)
+            FROM analytics_rollups WHERE grain=? AND tenant=? AND dimension=? AND bucket >= ? AND bucket < ?"""
+        params = [grain, tenant, dimension, lo, hi]
+        if key is not None:
+            sql += " AND key=?"
+            params.append(key)
+        c.execute(sql + " GROUP BY key", params)
+        for row in c.fetchall():
+            pending = totals.get(row[0], (0, 0, 0, 0))
+            totals[row[0]] = tuple(a + (b or 0) for a, b in zip(pending, row[1:]))
+    return totals
+
+def rollup_series(conn, tenant: str, start: datetime, end: datetime, grain: str, dimension: str = "tenant",
+                  key: Optional[str] = None) -> List[dict]:
+    """One row per bucket of the given grain that overlaps [start, end)."""
+    width = dict(ROLLUP_GRAINS)[grain]
+    start, end = utc_naive(start), utc_naive(end)
+    first = start.strftime("%Y-%m-%d %H")[:width]
+    last = (end - timedelta(microseconds=1)).strftime("%Y-%m-%d %H")[:width]
+    sql = """SELECT bucket, SUM(requests), SUM(completed), SUM(revenue), SUM(commission)
+        FROM analytics_rollups WHERE grain=? AND tenant=? AND dimension=? AND bucket >= ? AND bucket <= ?"""
+    params = [grain, tenant, dimension, first, last]
+    if key is not None:
+        sql += " AND key=?"
+        params.append(key)
+    c = conn.cursor()
+    c.execute(sql + " GROUP BY bucket ORDER BY bucket", params)
+    return [{"bucket": row[0], "requests": row[1], "completed": row[2], "revenue": row[3], "commission": row[4]}
+            for row in c.fetchall()]
+
+def backfill_rollups(conn, catalog_conn=None) -> int:
+    """Rebuild analytics_rollups from service_requests and ledger in one streaming pass.
+
+    Request creations and commission credits are read as one stream in time
+    order, so a day's buckets are final once the stream moves past it and only
+    one day of aggregates is held in memory. Runs in the caller's transaction,
+    which on SQLite also holds off writers until it commits. Categories and
+    prices come from the service catalog (home database), since a shard has
+    no services table of its own; pass catalog_conn when conn is the home one.
+    """
+    c = conn.cursor()
+    c.execute("DELETE FROM analytics_rollups")
+    # psycopg2 buffers whole result sets client-side unless the cursor is named
+    stream = conn.cursor(name=f"backfill_{uuid.uuid4().hex}") if DATABASE_URL else conn.cursor()
+    stream.execute("""
+        SELECT r.created_at, COALESCE(u.tenant, 'unknown'), r.service_id, r.mitra_id, 1, 0, 0
+        FROM service_requests r
+        LEFT JOIN users u ON u.id = r.mitra_id
+        UNION ALL
+        SELECT l.created_at, COALESCE(u.tenant, 'unknown'), r.service_id, l.mitra_id, 0, 1, l.amount
+        FROM ledger l
+        JOIN service_requests r ON r.id = l.reference_id
+        LEFT JOIN users u ON u.id = l.mitra_id
+        WHERE l.type = 'credit'
+        ORDER BY 1""")
+    services: dict = {}
+    pending: dict = {}
+    current_day, events = None, 0
+    while True:
+        rows = stream.fetchmany(EXPORT_FETCH_SIZE)
+        if not rows:
+            break
+        for created_at, tenant, service_id, mitra_id, requests, completed, commission in rows:
+            if service_id not in services:
+                services[service_id] = service_catalog.get(service_id, catalog_conn)
+            service = services[service_id]
+            category = service[2] if service else None
+            revenue = service[3] if service and completed else 0
+            if created_at[:10] != current_day and pending:
+                c.executemany(ROLLUP_UPSERT, [key + values for key, values in pending.items()])
+                pending = {}
+            current_day = created_at[:10]
+            coalesce_rollups(rollup_deltas(tenant, created_at, category, mitra_id,
+                                           requests, completed, revenue, commission), pending)
+            events += 1
+    if pending:
+        c.executemany(ROLLUP_UPSERT, [key + values for key, values in pending.items()])
+    return events
+
+# ===============================================================
+# AUDIT PIPELINE
+# ===============================================================
+
+def audit_row(user_id: str, role: str, action: str, ip_address: str) -> tuple:
+    return (str(uuid.uuid4()), user_id, role, action, ip_address, utc_timestamp())
+
+class AuditWriter:
+    """Bounded in-process queue drained by a background thread.
+
+    Rows are written with one executemany per batch, flushed when the batch
+    fills up or the flush interval elapses, and drained on shutdown. When the
+    queue is full the backpressure policy decides whether the caller blocks
+    (up to block_timeout), the new row is dropped, or the oldest row is dropped.
+    """
+
+    POLICIES = ("block", "drop_newest", "drop_oldest")
+
+    def __init__(self, maxsize: int, batch_size: int, flush_interval: float,
+                 policy: str, block_timeout: float):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown audit backpressure policy: {policy}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._batches = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._closed = False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def offer(self, row: tuple) -> bool:
+        """Non-blocking enqueue; False means the queue is full or the writer is closed."""
+        if self._closed:
+            return self._drop()
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            return False
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def submit(self, row: tuple) -> bool:
+        """Enqueue a row, applying the backpressure policy if the queue is full."""
+        if self.offer(row):
+            return True
+        if self._closed:
+            return False
+        if self.policy == "block":
+            try:
+                self._queue.put(row, timeout=self.block_timeout)
+            except queue.Full:
+                return self._drop()
+        elif self.policy == "drop_oldest":
+            try:
+                self._queue.get_nowait()
+                self._drop()
+                self._queue.put_nowait(row)
+            except (queue.Empty, queue.Full):
+                return self._drop()
+        else:
+            return self._drop()
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def _drop(self) -> bool:
+        with self._lock:
+            self._dropped += 1
+        return False
+
+    def _run(self):
+        batch: List[tuple] = []
+        deadline = time.monotonic() + self.flush_interval
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline or self._stop.is_set():
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+        self._flush(batch)
+
+    def _flush(self, batch: List[tuple]):
+        if not batch:
+            return
+        try:
+            with db_pool.connection() as conn:
+                audit_partitions.insert(conn, batch)
+        except Exception:
+            with self._lock:
+                self._failed += len(batch)
+            return
+        with self._lock:
+            self._written += len(batch)
+            self._batches += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "queued": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "batches": self._batches,
+                "dropped": self._dropped,
+                "failed": self._failed,
+            }
+
+    def close(self, timeout: float = 30):
+        """Stop the flusher once everything still queued has been written; later rows are refused."""
+        with self._lock:
+            self._closed = True
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+audit_writer = AuditWriter(AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL,
+                           AUDIT_BACKPRESSURE, AUDIT_BLOCK_TIMEOUT)
+
+# ===============================================================
+# ANALYTICS CACHE
+# ===============================================================
+
+class AnalyticsCache:
+    """TTL cache for the encoded /admin/analytics body with optional stale-while-revalidate.
+
+    Local writes invalidate as soon as they commit; other workers see them
+    within the TTL. A rebuild that was already reading when an invalidation
+    landed is served once but not kept as fresh.
+    Revalidation first compares the platform_counters version stamps of every
+    shard, so an unchanged dataset costs one primary-key read per shard
+    instead of a rebuild. Rebuilds fan out to the shards in parallel.
+    """
+
+    def __init__(self, ttl: float, swr: float):
+        self.ttl = ttl
+        self.swr = swr
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._generation = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+            self._version = None
+            self._generation += 1
+
+    def peek_etag(self) -> Optional[str]:
+        """ETag of the cached payload while it is still fresh, without touching the DB."""
+        with self._lock:
+            if self._body is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._etag
+        return None
+
+    def get(self):
+        with self._lock:
+            body, etag = self._body, self._etag
+            age = time.monotonic() - self._loaded_at
+        if body is not None and age < self.ttl:
+            return body, etag
+        if body is not None and age < self.ttl + self.swr:
+            if self._refreshing.acquire(blocking=False):
+                threading.Thread(target=self._refresh_locked, daemon=True).start()
+            return body, etag
+        with self._refreshing:
+            return self._refresh()
+
+    def _refresh_locked(self):
+        try:
+            self._refresh()
+        except Exception:
+            pass
+        finally:
+            self._refreshing.release()
+
+    def _refresh(self):
+        with self._lock:
+            generation = self._generation
+        version = tuple(tenant_router.fan_out(read_counters_version))
+        with self._lock:
+            if self._body is not None and version == self._version and generation == self._generation:
+                self._loaded_at = time.monotonic()
+                return self._body, self._etag
+        # Encoded once per rebuild; merge_analytics fixes the key and row order, so the ETag is stable
+        body = dump_json(merge_analytics(tenant_router.fan_out(lambda conn: load_analytics(conn.cursor()))))
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self._lock:
+            if generation == self._generation:
+                self._body, self._etag, self._version = body, etag, version
+                self._loaded_at = time.monotonic()
+        return body, etag
+
+def load_analytics(c) -> dict:
+    c.execute("SELECT name, value FROM platform_counters")
+    counters = dict(c.fetchall())
+    c.execute("SELECT * FROM state_analytics")
+    state_metrics = c.fetchall()
+    return {
+        "total_mitras": int(counters.get("total_mitras", 0)),
+        "total_requests": int(counters.get("total_requests", 0)),
+        "total_revenue": counters.get("total_revenue", 0),
+        "state_metrics": [{"state": row[1], "revenue": row[2], "requests": row[3]} for row in state_metrics]
+    }
+
+def read_counters_version(conn):
+    c = conn.cursor()
+    c.execute("SELECT value FROM platform_counters WHERE name='version'")
+    return c.fetchone()[0]
+
+def merge_analytics(parts: List[dict]) -> dict:
+    """Sum the per-shard counters; each state's metrics row lives on exactly one shard."""
+    merged = {"total_mitras": 0, "total_requests": 0, "total_revenue": 0, "state_metrics": []}
+    for part in parts:
+        for name in ("total_mitras", "total_requests", "total_revenue"):
+            merged[name] += part[name]
+        merged["state_metrics"] += part["state_metrics"]
+    merged["state_metrics"].sort(key=lambda m: m["state"])
+    return merged
+
+analytics_cache = AnalyticsCache(ANALYTICS_CACHE_TTL, ANALYTICS_CACHE_SWR)
+
+# ===============================================================
+# SERVICE CATALOG CACHE
+# ===============================================================
+
+class ServiceCatalog:
+    """Process-local copy of the services table, indexed by id and by tenant.
+
+    Writers bump platform_counters.catalog_version; each worker compares its
+    loaded version against the DB at most every check_interval seconds and
+    reloads on change. A lookup miss re-checks the version early, at most once
+    per check_interval, so unknown ids cannot drive repeated full reloads.
+    Reloads read outside the lock and only swap the result in under it, so a
+    pool wait never stalls readers or invalidate().
+    The MSME listing is kept as ready-to-send JSON bytes.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._by_id: dict = {}
+        self._listing: dict = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._miss_checked_at = 0.0
+        self._generation = 0
+
+    def is_fresh(self) -> bool:
+        return self._version is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    def invalidate(self):
+        # A reload that read before this point sees the generation move and is discarded
+        with self._lock:
+            self._checked_at = 0.0
+            self._version = None
+            self._generation += 1
+
+    def refresh(self, force: bool = False, conn=None, recheck: bool = False):
+        """Reload if the DB version moved (or force); safe to call from any thread.
+
+        recheck compares the version even while fresh. Handlers already holding
+        a connection pass it in, so a refresh never waits on a second pool slot.
+        """
+        if not (force or recheck) and self.is_fresh():
+            return
+        if conn is None:
+            with db_pool.connection() as own:
+                self._reload(own.cursor(), force)
+        else:
+            self._reload(conn.cursor(), force)
+
+    def _reload(self, c, force: bool):
+        with self._lock:
+            loaded, generation = self._version, self._generation
+        c.execute("SELECT value FROM platform_counters WHERE name='catalog_version'")
+        version = c.fetchone()[0]
+        loaded_rows = None
+        if force or version != loaded:
+            c.execute("SELECT * FROM services")
+            loaded_rows = self._index(c.fetchall())
+        with self._lock:
+            # Invalidated meanwhile, or a concurrent reload already installed something newer
+            if generation != self._generation or (self._version is not None and version < self._version):
+                return
+            if loaded_rows is not None:
+                self._by_id, self._listing = loaded_rows
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    @staticmethod
+    def _index(rows) -> tuple:
+        by_id, by_tenant = {}, {}
+        for row in rows:
+            by_id[row[0]] = row
+            by_tenant.setdefault(row[5], []).append({"id": row[0], "name": row[1], "price": row[3]})
+        return by_id, {tenant: json.dumps(items).encode() for tenant, items in by_tenant.items()}
+
+    def get(self, service_id: str, conn=None):
+        """Service row by id; a miss re-checks the version in case another worker just added it."""
+        self.refresh(conn=conn)
+        row = self._by_id.get(service_id)
+        if row is None and time.monotonic() - self._miss_checked_at >= self.check_interval:
+            self._miss_checked_at = time.monotonic()
+            self.refresh(conn=conn, recheck=True)
+            row = self._by_id.get(service_id)
+        return row
+
+    def listing(self, tenant: str) -> bytes:
+        """As of the last refresh; callers on the event loop refresh through the executor first."""
+        return self._listing.get(tenant, b"[]")
+
+def bump_catalog_version(conn):
+    conn.cursor().execute("UPDATE platform_counters SET value = value + 1 WHERE name='catalog_version'")
+    after_commit(service_catalog.invalidate)
+
+service_catalog = ServiceCatalog(CATALOG_CHECK_INTERVAL)
+
+# ===============================================================
+# CREDIT SCORING
+# ===============================================================
+
+GSTIN_PATTERN = re.compile(r"^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][1-9A-Z]Z[0-9A-Z]$")
+GSTIN_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+def gstin_is_valid(gstin: Optional[str]) -> bool:
+    """Format plus the mod-36 check digit in position 15."""
+    if not gstin or not GSTIN_PATTERN.match(gstin):
+        return False
+    total = 0
+    for i, ch in enumerate(gstin[:14]):
+        product = GSTIN_CHARS.index(ch) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return gstin[14] == GSTIN_CHARS[(36 - total % 36) % 36]
+
+# Logistic model over the feature columns below; z > 0 means more likely to repay
+CREDIT_MODEL_INTERCEPT = -1.0
+CREDIT_MODEL_WEIGHTS = (
+    ("ledger_volume", 0.25),        # log1p(total credits)
+    ("ledger_activity", 0.15),      # log1p(number of credits)
+    ("utilization", -0.8),          # debits / credits, capped at 2
+    ("request_volume", 0.1),        # log1p(service requests handled)
+    ("completion_rate", 0.8),       # completed / handled
+    ("gstin_valid", 0.9),
+    ("vintage_years", 0.3),         # account age, capped at 5
+    ("prior_disbursed", 0.35),      # capped at 5
+    ("prior_rejected", -0.45),      # capped at 5
+)
+CREDIT_FACTOR_LABELS = {
+    "ledger_volume": "Ledger earnings volume",
+    "ledger_activity": "Regular ledger activity",
+    "utilization": "Wallet utilization",
+    "request_volume": "Service request volume",
+    "completion_rate": "Request completion rate",
+    "gstin_valid": "Valid GSTIN",
+    "vintage_years": "Account vintage",
+    "prior_disbursed": "Prior loans disbursed",
+    "prior_rejected": "Prior loan rejections",
+}
+
+# One round-trip per chunk of applicants; every subquery is an index lookup
+CREDIT_FEATURES_SQL = """SELECT u.id, u.created_at,
+        COALESCE(w.credits, 0), COALESCE(w.debits, 0),
+        (SELECT COUNT(*) FROM ledger l WHERE l.mitra_id = u.id AND l.type = 'credit'),
+        (SELECT COUNT(*) FROM service_requests r WHERE r.mitra_id = u.id)
+            + (SELECT COUNT(*) FROM service_requests r WHERE r.msme_id = u.id),
+        (SELECT COUNT(*) FROM service_requests r WHERE r.mitra_id = u.id AND r.status = 'completed')
+            + (SELECT COUNT(*) FROM service_requests r WHERE r.msme_id = u.id AND r.status = 'completed'),
+        (SELECT COUNT(*) FROM loan_applications a WHERE a.mitra_id = u.id AND a.status = 'disbursed'),
+        (SELECT COUNT(*) FROM loan_applications a WHERE a.mitra_id = u.id AND a.status = 'rejected')
+    FROM users u LEFT JOIN wallet_balances w ON w.mitra_id = u.id
+    WHERE u.id IN ({placeholders})"""
+CREDIT_QUERY_CHUNK = 500
+
+class CreditScorer:
+    """Batch credit scoring: one feature query per chunk, one NumPy pass per batch.
+
+    Scores are memoized per (applicant, GSTIN) in a bounded LRU and stamped
+    with the applicant's wallet_balances.updated_at, which every ledger write
+    moves. A batch re-reads only those stamps, so new ledger activity from any
+    worker invalidates an entry at once. Request and loan activity moves no
+    stamp (and applicants without a wallet, such as MSMEs, have none), so
+    entries also expire after ttl seconds.
+    """
+
+    def __init__(self, cache_size: int, ttl: float):
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _chunks(ids: List[str]):
+        for i in range(0, len(ids), CREDIT_QUERY_CHUNK):
+            yield ids[i:i + CREDIT_QUERY_CHUNK]
+
+    def _stamps(self, c, ids: List[str]) -> dict:
+        stamps = {}
+        for chunk in self._chunks(ids):
+            c.execute(f"SELECT mitra_id, updated_at FROM wallet_balances WHERE mitra_id IN ({', '.join('?' * len(chunk))})",
+                      chunk)
+            stamps.update(c.fetchall())
+        return stamps
+
+    def load_features(self, c, ids: List[str]) -> dict:
+        """Raw feature rows by applicant id; unknown ids are absent."""
+        rows = {}
+        for chunk in self._chunks(ids):
+            c.execute(CREDIT_FEATURES_SQL.format(placeholders=", ".join("?" * len(chunk))), chunk)
+            rows.update((row[0], row[1:]) for row in c.fetchall())
+        return rows
+
+    @staticmethod
+    def score_arrays(raw: List[tuple], gstin_valid: List[bool]):
+        """Vectorized model: (scores 300-900, default probabilities, per-feature contributions)."""
+        import numpy as np
+
+        now = np.datetime64(datetime.utcnow(), "us")
+        created = np.array([row[0] or now for row in raw], dtype="datetime64[us]")
+        values = np.array([row[1:] for row in raw], dtype=np.float64).reshape(len(raw), 7)
+        credits, debits, entries, handled, completed, disbursed, rejected = values.T
+        features = np.column_stack([
+            np.log1p(credits),
+            np.log1p(entries),
+            np.minimum(debits / np.maximum(credits, 1.0), 2.0),
+            np.log1p(handled),
+            completed / np.maximum(handled, 1.0),
+            np.asarray(gstin_valid, dtype=np.float64),
+            np.minimum((now - created) / np.timedelta64(365, "D"), 5.0),
+            np.minimum(disbursed, 5.0),
+            np.minimum(rejected, 5.0),
+        ])
+        contributions = features * np.array([w for _, w in CREDIT_MODEL_WEIGHTS])
+        repay = 1.0 / (1.0 + np.exp(-(CREDIT_MODEL_INTERCEPT + contributions.sum(axis=1))))
+        scores = np.clip(np.rint(300 + 600 * repay), 300, 900).astype(np.int64)
+        return scores, 1.0 - repay, contributions
+
+    def score_many(self, conn, applicants: List[tuple], explain: bool = False) -> List[dict]:
+        """Score (applicant_id, gstin) pairs in input order.
+
+        explain=True bypasses the cache and adds the top factors to each result.
+        """
+        c = conn.cursor()
+        ids = sorted({applicant_id for applicant_id, _ in applicants})
+        stamps = self._stamps(c, ids) if self.cache_size > 0 else {}
+        results: List[Optional[dict]] = [None] * len(applicants)
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for i, (applicant_id, gstin) in enumerate(applicants):
+                entry = None if explain else self._entries.get((applicant_id, gstin))
+                if entry is not None and entry[0] == stamps.get(applicant_id) and entry[2] > now:
+                    self._entries.move_to_end((applicant_id, gstin))
+                    results[i] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(i)
+            self.misses += len(missing)
+        if not missing:
+            return results
+
+        features = self.load_features(c, sorted({applicants[i][0] for i in missing}))
+        blank = (None, 0, 0, 0, 0, 0, 0, 0)
+        raw = [features.get(applicants[i][0], blank) for i in missing]
+        scores, default_p, contributions = self.score_arrays(raw, [gstin_is_valid(applicants[i][1]) for i in missing])
+        with self._lock:
+            for row, i in enumerate(missing):
+                applicant_id, gstin = applicants[i]
+                result = {"score": int(scores[row]), "default_probability": round(float(default_p[row]), 4)}
+                if explain:
+                    ranked = sorted(zip(CREDIT_MODEL_WEIGHTS, contributions[row]), key=lambda item: -abs(item[1]))
+                    result["factors"] = [f"{CREDIT_FACTOR_LABELS[name]} ({'+' if value >= 0 else '-'})"
+                                         for (name, _), value in ranked[:3] if value != 0]
+                elif self.cache_size > 0:
+                    self._entries[(applicant_id, gstin)] = (stamps.get(applicant_id), result, now + self.ttl)
+                    if len(self._entries) > self.cache_size:
+                        self._entries.popitem(last=False)
+                results[i] = result
+        return results
+
+    def score(self, conn, applicant_id: str, gstin: Optional[str], explain: bool = False) -> dict:
+        return self.score_many(conn, [(applicant_id, gstin)], explain)[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "capacity": self.cache_size, "hits": self.hits, "misses": self.misses}
+
+credit_scorer = CreditScorer(CREDIT_SCORE_CACHE_SIZE, CREDIT_SCORE_CACHE_TTL)
+
+# ===============================================================
+# GST RECONCILIATION
+# ===============================================================
+# Invoice lines from GSTR-2A (supplier-reported) and GSTR-3B (claimed) are
+# streamed through a generator pipeline: byte lines -> parsed records ->
+# matcher. The matcher keeps unmatched invoices in a hash index keyed by
+# (supplier GSTIN, invoice number) and emits a result as soon as the other
+# side arrives, so memory tracks unmatched invoices rather than file size; past
+# GST_INDEX_MAX_ENTRIES the oldest are spilled to a temporary SQLite file.
+#
+# Input is CSV with a header row, or NDJSON, with fields:
+#   return_type (2A or 3B), gstin, invoice_no, invoice_date, taxable_value, tax_amount
+
+GST_FIELDS = ("return_type", "gstin", "invoice_no", "invoice_date", "taxable_value", "tax_amount")
+GST_INVOICE_KEY = re.compile(r"[^0-9A-Z]")
+
+def parse_gst_line(offset: int, fields: dict):
+    """(offset, return_type, key, invoice_date, taxable_value, tax_amount), or (offset, None, error).
+
+    Plain tuples, so records cross process boundaries and spill to disk cheaply.
+    """
+    return_type = str(fields.get("return_type") or "").strip().upper()
+    if return_type not in ("2A", "3B"):
+        return (offset, None, f"return_type must be 2A or 3B, got {return_type or 'nothing'}")
+    gstin = str(fields.get("gstin") or "").strip().upper()
+    if not gstin_is_valid(gstin):
+        return (offset, None, f"Invalid GSTIN {gstin}")
+    invoice = GST_INVOICE_KEY.sub("", str(fields.get("invoice_no") or "").upper())
+    if not invoice:
+        return (offset, None, "Missing invoice_no")
+    try:
+        taxable = float(fields.get("taxable_value") or 0)
+        tax = float(fields.get("tax_amount") or 0)
+    except (TypeError, ValueError):
+        return (offset, None, "taxable_value and tax_amount must be numbers")
+    return (offset, return_type, gstin + "|" + invoice, str(fields.get("invoice_date") or ""), taxable, tax)
+
+def iter_gst_lines(path: str, start: int = 0, end: Optional[int] = None):
+    """(byte offset, line) for lines that begin inside [start, end)."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if end is not None and offset >= end:
+                break
+            yield offset, line
+            offset += len(line)
+
+def parse_gst_lines(lines, header: Optional[List[str]]):
+    """Stage 2: decode and parse; header=None means NDJSON."""
+    for offset, raw in lines:
+        text = raw.decode("utf-8", errors="replace").strip()
+        if not text:
+            continue
+        if header is None:
+            try:
+                fields = json.loads(text)
+            except ValueError as e:
+                yield (offset, None, f"Malformed JSON: {e}")
+                continue
+            if not isinstance(fields, dict):
+                yield (offset, None, "Each line must be a JSON object")
+                continue
+        else:
+            fields = dict(zip(header, next(csv.reader([text]))))
+        yield parse_gst_line(offset, fields)
+
+def parse_gst_chunk(path: str, start: int, end: int, header: Optional[List[str]]) -> list:
+    """Worker-process entry point: parse one byte range of the spooled file."""
+    return list(parse_gst_lines(iter_gst_lines(path, start, end), header))
+
+def read_gst_header(path: str, is_ndjson: bool):
+    """(header fields or None for NDJSON, byte offset where records start)."""
+    if is_ndjson:
+        return None, 0
+    with open(path, "rb") as f:
+        first = f.readline()
+    return parse_gst_header(first), len(first)
+
+def parse_gst_header(first: bytes) -> List[str]:
+    header = [h.strip().lower() for h in next(csv.reader([first.decode("utf-8-sig", errors="replace")]), [])]
+    missing = [name for name in GST_FIELDS if name not in header]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"CSV header is missing {', '.join(missing)}")
+    return header
+
+def iter_gst_records(path: str, header: Optional[List[str]], start: int, workers: int):
+    """Parsed records in file order, inline or fanned out over byte-range chunks."""
+    if workers <= 1:
+        yield from parse_gst_lines(iter_gst_lines(path, start), header)
+        return
+    size = os.path.getsize(path)
+    # Every boundary is moved forward to the next line start, so no line is split
+    bounds = []
+    with open(path, "rb") as f:
+        offset = start
+        while offset < size:
+            f.seek(min(offset + GST_CHUNK_BYTES, size))
+            f.readline()
+            bounds.append((offset, min(f.tell(), size)))
+            offset = f.tell()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # A bounded window of chunks in flight keeps parsed-but-unconsumed records bounded too
+        pending = deque()
+        for lo, hi in bounds:
+            pending.append(pool.submit(parse_gst_chunk, path, lo, hi, header))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+class InvoiceIndex:
+    """Unmatched invoices by key, oldest spilled to a temporary SQLite file past max_entries."""
+
+    def __init__(self, max_entries: int, spill_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self._memory: dict = {}
+        self._spill = None
+        self._spill_path = None
+        self.spilled = 0
+        self.spilled_total = 0
+
+    def __len__(self):
+        return len(self._memory) + self.spilled
+
+    def put(self, key: str, record: tuple):
+        self._memory[key] = record
+        if len(self._memory) > self.max_entries:
+            self._evict(max(1, self.max_entries // 10))
+
+    def _evict(self, count: int):
+        if self._spill is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix="gst-spill-", suffix=".db", dir=self.spill_dir)
+            os.close(fd)
+            import sqlite3
+            self._spill = sqlite3.connect(self._spill_path)
+            self._spill.execute("PRAGMA journal_mode=OFF")
+            self._spill.execute("PRAGMA synchronous=OFF")
+            self._spill.execute("CREATE TABLE spill(key TEXT PRIMARY KEY, record TEXT)")
+        keys = [key for key, _ in zip(self._memory, range(count))]  # dicts keep insertion order
+        self._spill.executemany("INSERT OR REPLACE INTO spill VALUES (?, ?)",
+                                [(key, json.dumps(self._memory.pop(key))) for key in keys])
+        self.spilled += len(keys)
+        self.spilled_total += len(keys)
+
+    def pop(self, key: str) -> Optional[tuple]:
+        record = self._memory.pop(key, None)
+        if record is None and self.spilled:
+            row = self._spill.execute("SELECT record FROM spill WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                self._spill.execute("DELETE FROM spill WHERE key=?", (key,))
+                self.spilled -= 1
+                record = tuple(json.loads(row[0]))
+        return record
+
+    def drain(self):
+        yield from self._memory.values()
+        self._memory = {}
+        if self._spill is not None:
+            for (record,) in self._spill.execute("SELECT record FROM spill"):
+                yield tuple(json.loads(record))
+            self.spilled = 0
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            os.unlink(self._spill_path)
+            self._spill = None
+
+def _gst_invoice(record: tuple) -> dict:
+    gstin, invoice = record[2].split("|", 1)
+    return {"gstin": gstin, "invoice_no": invoice, "invoice_date": record[3],
+            "taxable_value": record[4], "tax_amount": record[5], "offset": record[0]}
+
+def reconcile_gst(records, index: InvoiceIndex, tolerance: float = GST_MATCH_TOLERANCE):
+    """Stage 3: match 2A against 3B; yields result dicts, then one {"summary": ...}."""
+    counts = Counter()
+    tax = {"2A": 0.0, "3B": 0.0}
+    itc_at_risk = 0.0
+    for record in records:
+        if record[1] is None:
+            counts["invalid"] += 1
+            yield {"status": "invalid", "offset": record[0], "error": record[2]}
+            continue
+        counts["records"] += 1
+        tax[record[1]] += record[5]
+        other = index.pop(record[2])
+        if other is None:
+            index.put(record[2], record)
+        elif other[1] == record[1]:
+            index.put(record[2], other)
+            counts["duplicate"] += 1
+            yield {"status": "duplicate", "return_type": record[1], **_gst_invoice(record)}
+        else:
+            a2, b3 = (other, record) if other[1] == "2A" else (record, other)
+            if abs(a2[4] - b3[4]) > tolerance or abs(a2[5] - b3[5]) > tolerance:
+                counts["mismatch"] += 1
+                itc_at_risk += max(0.0, b3[5] - a2[5])
+                yield {"status": "mismatch", "invoice_2a": _gst_invoice(a2), "invoice_3b": _gst_invoice(b3),
+                       "tax_difference": round(b3[5] - a2[5], 2)}
+            else:
+                counts["matched"] += 1
+    for record in index.drain():
+        status = "missing_in_3b" if record[1] == "2A" else "missing_in_2a"
+        counts[status] += 1
+        if status == "missing_in_2a":
+            # Claimed in 3B but never reported by the supplier: the credit is at risk
+            itc_at_risk += record[5]
+        yield {"status": status, **_gst_invoice(record)}
+    pairs = counts["matched"] + counts["mismatch"] + counts["missing_in_2a"] + counts["missing_in_3b"]
+    compliance_score = round(100 * counts["matched"] / pairs) if pairs else 100
+    yield {"summary": {
+        **{k: counts[k] for k in ("records", "matched", "mismatch", "missing_in_2a", "missing_in_3b",
+                                  "duplicate", "invalid")},
+        "total_tax_2a": round(tax["2A"], 2),
+        "total_tax_3b": round(tax["3B"], 2),
+        "itc_at_risk": round(itc_at_risk, 2),
+        "compliance_score": compliance_score,
+        "risk_level": "Low" if compliance_score >= 90 else "Medium" if compliance_score >= 70 else "High",
+        "spilled_to_disk": index.spilled_total,
+    }}
+
+def gst_recommendations(summary: dict) -> List[str]:
+    tips = []
+    if summary["missing_in_2a"]:
+        tips.append(f"Follow up with suppliers on {summary['missing_in_2a']} invoices missing from GSTR-2A")
+    if summary["mismatch"]:
+        tips.append(f"Correct {summary['mismatch']} invoices whose values differ between GSTR-2A and GSTR-3B")
+    if summary["missing_in_3b"]:
+        tips.append(f"Review {summary['missing_in_3b']} GSTR-2A invoices not claimed in GSTR-3B")
+    return tips or ["File GSTR-3B by 20th"]
+
+# ===============================================================
+# ROW MODELS & JSON RESPONSES
+# ===============================================================
+
+def _json_default(obj):
+    if isinstance(obj, RowModel):
+        return {name: getattr(obj, name) for name in obj.__slots__}
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dump_json(content) -> bytes:
+    """Compact JSON bytes; orjson when installed, which also encodes row models natively."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode()
+
+class FastJSONResponse(Response):
+    """JSONResponse without FastAPI's jsonable_encoder pass: handlers return it directly."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dump_json(content)
+
+class CleanupStreamingResponse(StreamingResponse):
+    """StreamingResponse that runs cleanup() however the response ends.
+
+    A BackgroundTask is skipped when the client disconnects, and a generator's
+    own finally never runs if iteration never starts, so neither can own a
+    temp file on its own.
+    """
+
+    def __init__(self, content, cleanup: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cleanup()
+
+class RowModel:
+    """Compact, typed list row built straight from a query tuple.
+
+    Subclasses are slotted dataclasses whose COLUMNS are the SQL expressions
+    for their fields, in field order, followed by the keyset sort column; the
+    first field is always the id. A fetched row is therefore the fields plus
+    one trailing sort value, so `of` builds the model and `key` the cursor key.
+    """
+    __slots__ = ()
+    COLUMNS: tuple = ()
+
+    @classmethod
+    def select(cls, source: str) -> str:
+        return f"SELECT {', '.join(cls.COLUMNS)} FROM {source}"
+
+    @classmethod
+    def of(cls, row: tuple) -> "RowModel":
+        return cls(*row[:-1])
+
+    @staticmethod
+    def key(row: tuple) -> tuple:
+        return row[-1], row[0]
+
+@dataclass
+class AuditRow(RowModel):
+    __slots__ = ("id", "user_id", "role", "action", "ip", "time")
+    COLUMNS = ("id", "user_id", "role", "action", "ip_address", "timestamp", "timestamp")
+    id: str
+    user_id: str
+    role: str
+    action: str
+    ip: str
+    time: str
+
+@dataclass
+class ComplianceRow(RowModel):
+    __slots__ = ("id", "user_id", "action", "time")
+    COLUMNS = ("a.id", "a.user_id", "a.action", "a.timestamp", "a.timestamp")
+    id: str
+    user_id: str
+    action: str
+    time: str
+
+@dataclass
+class MitraLoanRow(RowModel):
+    __slots__ = ("id", "applicant", "amount", "status")
+    COLUMNS = ("id", "applicant_name", "requested_amount", "status", "created_at")
+    id: str
+    applicant: str
+    amount: float
+    status: str
+
+@dataclass
+class LoanQueueRow(RowModel):
+    __slots__ = ("id", "applicant", "gstin", "score", "amount")
+    COLUMNS = ("id", "applicant_name", "gstin", "credit_score", "requested_amount", "created_at")
+    id: str
+    applicant: str
+    gstin: str
+    score: int
+    amount: float
+
+# ===============================================================
+# PAGINATION & EXPORT
+# ===============================================================
+
+# Every keyset sort column is a stored timestamp (format_timestamp; older rows may lack the fraction)
+CURSOR_TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,6})?$")
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    """[sort timestamp, id] from a cursor; anything else is a 400, never a driver error."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        key = None
+    if (not isinstance(key, list) or len(key) != 2 or not all(isinstance(part, str) for part in key)
+            or not CURSOR_TIMESTAMP.match(key[0])):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+def keyset_query(select: str, filters: List[str], params: list, keys: tuple,
+                 cursor: Optional[str], descending: bool = True):
+    """Append the keyset predicate and ORDER BY for a (sort column, id) pair."""
+    filters, params = list(filters), list(params)
+    if cursor:
+        filters.append(f"({keys[0]}, {keys[1]}) {'<' if descending else '>'} (?, ?)")
+        params += decode_cursor(cursor)
+    direction = "DESC" if descending else "ASC"
+    sql = select
+    if filters:
+        sql += " WHERE " + " AND ".join(filters)
+    sql += f" ORDER BY {keys[0]} {direction}, {keys[1]} {direction}"
+    return sql, params
+
+def _page_response(rows: list, model, limit: int) -> FastJSONResponse:
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(model.key(rows[-1]))
+    return FastJSONResponse([model.of(row) for row in rows], headers=headers)
+
+def list_page(conn, sql: str, params: list, model, limit: int) -> FastJSONResponse:
+    """Fetch one page of `model` rows; if more rows remain, hand back X-Next-Cursor."""
+    return list_page_across(conn, [(sql, params)], model, limit)
+
+def list_page_across(conn, queries: List[tuple], model, limit: int) -> FastJSONResponse:
+    """list_page over (sql, params) queries that are consecutive in page order, e.g. partitions."""
+    c = conn.cursor()
+    rows = []
+    for sql, params in queries:
+        c.execute(sql + " LIMIT ?", params + [limit + 1 - len(rows)])
+        rows += c.fetchall()
+        if len(rows) > limit:
+            break
+    return _page_response(rows, model, limit)
+
+def ndjson_export(sql: str, params: list, model, pool: Optional[ConnectionPool] = None) -> StreamingResponse:
+    """Stream every row after the cursor as NDJSON, holding one fetch batch in memory."""
+    return ndjson_export_across([(sql, params)], model, pool)
+
+def _export_rows(pool: ConnectionPool, queries: List[tuple]):
+    with pool.connection() as conn:
+        for sql, params in queries:
+            # psycopg2 buffers whole result sets client-side unless the cursor is named
+            c = conn.cursor(name=f"export_{uuid.uuid4().hex}") if DATABASE_URL else conn.cursor()
+            c.execute(sql, params)
+            while True:
+                rows = c.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+
+def ndjson_export_across(queries: List[tuple], model, pool: Optional[ConnectionPool] = None) -> StreamingResponse:
+    def stream():
+        for rows in _export_rows(pool or db_pool, queries):
+            yield b"".join(dump_json(model.of(row)) + b"\n" for row in rows)
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def list_page_sharded(sql: str, params: list, model, limit: int, descending: bool = True) -> FastJSONResponse:
+    """list_page over every shard: each returns its own first limit + 1 rows and the pages merge by key."""
+    def page(conn):
+        c = conn.cursor()
+        c.execute(sql + " LIMIT ?", params + [limit + 1])
+        return c.fetchall()
+    rows = list(heapq.merge(*tenant_router.fan_out(page), key=model.key, reverse=descending))
+    return _page_response(rows, model, limit)
+
+def ndjson_export_sharded(sql: str, params: list, model, descending: bool = True) -> StreamingResponse:
+    """ndjson_export over every shard, merged into one stream in key order."""
+    def stream():
+        streams = [(row for rows in _export_rows(pool, [(sql, params)]) for row in rows)
+                   for pool in tenant_router.pools()]
+        batch = []
+        for row in heapq.merge(*streams, key=model.key, reverse=descending):
+            batch.append(dump_json(model.of(row)) + b"\n")
+            if len(batch) >= EXPORT_FETCH_SIZE:
+                yield b"".join(batch)
+                batch = []
+        yield b"".join(batch)
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# ===============================================================
+# AUDIT ARCHIVE
+# ===============================================================
+
+def _archive_suffix() -> str:
+    try:
+        import zstandard  # noqa: F401
+        return ".ndjson.zst"
+    except ImportError:
+        return ".ndjson.gz"
+
+def _open_archive(path: str, mode: str):
+    if path.endswith(".zst"):
+        import zstandard
+        return zstandard.open(path, mode, encoding="utf-8")
+    return gzip.open(path, mode, encoding="utf-8")
+
+def archive_audit_partitions(conn, retention_days: int = AUDIT_RETENTION_DAYS,
+                             archive_dir: str = AUDIT_ARCHIVE_DIR) -> List[dict]:
+    """Roll day partitions older than the retention window into compressed NDJSON, then drop them.
+
+    Rows are written with the user's tenant resolved, so archives can be
+    searched without the users table. Each day commits on its own, after its
+    file and sidecar .meta.json are in place; a day that gains late rows after
+    being archived gets a second file rather than overwriting the first.
+    """
+    c = conn.cursor()
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+    suffix = _archive_suffix()
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for day in sorted(audit_partitions.list(c)):
+        if day >= cutoff:
+            break
+        base, n = f"audit_logs_{day}", 1
+        while os.path.exists(os.path.join(archive_dir, base + ".meta.json")):
+            n += 1
+            base = f"audit_logs_{day}_{n}"
+        path = os.path.join(archive_dir, base + suffix)
+        stream = conn.cursor(name=f"archive_{uuid.uuid4().hex}") if DATABASE_URL else conn.cursor()
+        stream.execute(f"""SELECT a.id, a.user_id, a.role, a.action, a.ip_address, a.timestamp, u.tenant
+            FROM {audit_partitions.table(day)} a LEFT JOIN users u ON u.id = a.user_id
+            ORDER BY a.timestamp, a.id""")
+        rows, tenants, first, last = 0, set(), None, None
+        with _open_archive(path + ".tmp", "wt") as f:
+            while True:
+                batch = stream.fetchmany(EXPORT_FETCH_SIZE)
+                if not batch:
+                    break
+                for r in batch:
+                    f.write(json.dumps({"id": r[0], "user_id": r[1], "role": r[2], "action": r[3],
+                                        "ip": r[4], "time": r[5], "tenant": r[6]}) + "\n")
+                    tenants.add(r[6])
+                first = first or batch[0][5]
+                last = batch[-1][5]
+                rows += len(batch)
+        os.replace(path + ".tmp", path)
+        meta = {"day": day, "file": base + suffix, "rows": rows, "first": first, "last": last,
+                "tenants": sorted(t for t in tenants if t)}
+        with open(os.path.join(archive_dir, base + ".meta.json"), "w") as f:
+            json.dump(meta, f)
+        audit_partitions.drop(c, day)
+        conn.commit()
+        archived.append(meta)
+    return archived
+
+def search_audit_archives(user_id: Optional[str] = None, tenant: Optional[str] = None,
+                          start: Optional[str] = None, end: Optional[str] = None, limit: int = PAGE_SIZE_DEFAULT,
+                          archive_dir: str = AUDIT_ARCHIVE_DIR) -> List[dict]:
+    """Archived rows in [start, end), oldest first.
+
+    Files are pruned by their sidecar's time bounds and tenant list before
+    anything is decompressed, and lines that cannot contain the user id are
+    skipped before JSON parsing.
+    """
+    if not os.path.isdir(archive_dir):
+        return []
+    results = []
+    for name in sorted(n for n in os.listdir(archive_dir) if n.endswith(".meta.json")):
+        with open(os.path.join(archive_dir, name)) as f:
+            meta = json.load(f)
+        if not meta["rows"] or (start and meta["last"] < start) or (end and meta["first"] >= end):
+            continue
+        if tenant and tenant not in meta["tenants"]:
+            continue
+        with _open_archive(os.path.join(archive_dir, meta["file"]), "rt") as f:
+            for line in f:
+                if user_id and user_id not in line:
+                    continue
+                row = json.loads(line)
+                if ((user_id and row["user_id"] != user_id) or (tenant and row["tenant"] != tenant)
+                        or (start and row["time"] < start) or (end and row["time"] >= end)):
+                    continue
+                results.append(row)
+                if len(results) >= limit:
+                    return results
+    return results
 
 # ===============================================================
 # MIDDLEWARE
@@ -193,15 +2808,102 @@ async def audit_log_middleware(request: Request, call_next):
     client_ip = request.client.host if request.client else "unknown"
     action = f"{request.method} {request.url.path}"
     
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("INSERT INTO audit_logs VALUES (?, ?, ?, ?, ?, ?)",
-              (str(uuid.uuid4()), "system", "middleware", action, client_ip, str(datetime.utcnow())))
-    conn.commit()
-    conn.close()
+    row = audit_row("system", "middleware", action, client_ip)
+    if not audit_writer.offer(row):
+        # Queue is full: apply the backpressure policy off the event loop
+        await run_in_threadpool(audit_writer.submit, row)
     
     return response
 
+class SamplingProfiler:
+    """Samples every thread's stack while one request runs and folds the result.
+
+    Output is the collapsed-stack format ("frame;frame;frame count" per line)
+    that flamegraph.pl and speedscope read directly. Sampling is process-wide,
+    so the event loop and the DB executor thread serving the request both show
+    up, along with whatever else the worker is doing. One profile at a time.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._busy = threading.Lock()
+        self._stop = threading.Event()
+        self._samples: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        if not self._busy.acquire(blocking=False):
+            return False
+        self._stop.clear()
+        self._samples = Counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._samples[";".join(reversed(stack))] += 1
+            if self._stop.wait(self.interval):
+                break
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        samples = self._samples
+        self._busy.release()
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+profiler = SamplingProfiler(PROFILE_INTERVAL)
+
+# Registered last, so it wraps audit_log_middleware and times the whole request
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    if not metrics.enabled:
+        return await call_next(request)
+    stats = _RequestStats()
+    token = _request_stats.set(stats)
+    profiling = (bool(PROFILE_TOKEN) and hmac.compare_digest(request.headers.get("x-profile", ""), PROFILE_TOKEN)
+                 and profiler.start())
+    status, stacks = 500, None
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if profiling:
+            # Drain the body inside the sampling window; the dump replaces it
+            async for _ in response.body_iterator:
+                pass
+    finally:
+        elapsed = time.perf_counter() - started
+        _request_stats.reset(token)
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.observe_request(request.method, route, status, elapsed, stats)
+        if profiling:
+            stacks = profiler.stop()
+
+    timing = f"app;dur={elapsed * 1000:.2f}, db;dur={stats.db_seconds * 1000:.2f}"
+    if stacks is None:
+        response.headers["Server-Timing"] = timing
+        return response
+    # Profiled requests also get the per-statement DB split, slowest first
+    ranked = sorted(stats.statements.items(), key=lambda item: item[1][1], reverse=True)
+    timing += "".join(f', sql{i};dur={total * 1000:.2f};desc="{count}x {label[:200].replace(chr(34), chr(39))}"'
+                      for i, (label, (count, total)) in enumerate(ranked, 1))
+    return Response(content=stacks, media_type="text/plain",
+                    headers={"Server-Timing": timing, "X-Profiled-Status": str(status)})
+
 # ===============================================================
 # MODELS
 # ===============================================================
@@ -243,237 +2945,312 @@ class NBFCModel(BaseModel):
 class AIQueryModel(BaseModel):
     data: str
 
+class BulkRequestModel(RequestModel):
+    status: str = "in_progress"  # historical imports may arrive already completed
+    created_at: Optional[datetime] = None
+
+class LedgerEntryModel(BaseModel):
+    mitra_id: str
+    amount: float = Field(gt=0, allow_inf_nan=False)
+    type: str  # credit, debit
+    reference_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+
 # ===============================================================
 # 1. AUTH MODULE
 # ===============================================================
 
 @app.post("/register", tags=["Auth"])
-def register(data: RegisterModel, request: Request):
-    conn = get_db()
+async def register(data: RegisterModel, request: Request):
+    # Hash before taking a connection: the KDF is the slow part
+    password_hash = await password_hasher.hash(data.password)
+    # Resolve (and on first use migrate) the shard before the home transaction; unknown tenants stop here
+    shard = await adb.call(tenant_router.pool, data.tenant)
+    row = (str(uuid.uuid4()), data.name, data.email, password_hash, data.role, data.tenant, "pending", utc_timestamp())
+    ip = request.client.host if request.client else "unknown"
+    if shard is db_pool:
+        return await adb.run(_insert_user, row, ip)
+    # Shard-local copy for joins, credentials stay on the home database only; removed if the home insert fails
+    await adb.run_on(shard, _mirror_user, row)
+    try:
+        return await adb.run(_insert_user, row, ip)
+    except Exception:
+        await adb.run_on(shard, _unmirror_user, row[0])
+        raise
+
+def _insert_user(row: tuple, ip: str, conn):
     c = conn.cursor()
-    user_id = str(uuid.uuid4())
-    
+    user_id, role = row[0], row[4]
     try:
-        c.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                  (user_id, data.name, data.email, hash_password(data.password), 
-                   data.role, data.tenant, "pending", str(datetime.utcnow())))
-        conn.commit()
+        c.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    conn.close()
-    log_audit(user_id, data.role, "User Registered", request.client.host if request.client else "unknown")
+    if role == "mitra":
+        bump_counters(conn, total_mitras=1)
+    log_audit(user_id, role, "User Registered", ip)
     return {"message": "Registration successful", "user_id": user_id}
 
-@app.post("/login", tags=["Auth"])
-def login(data: LoginModel, request: Request):
-    conn = get_db()
+def _mirror_user(row: tuple, conn):
+    conn.cursor().execute(SHARD_USER_INSERT, row[:3] + (None,) + row[4:])
+
+def _unmirror_user(user_id: str, conn):
+    conn.cursor().execute("DELETE FROM users WHERE id=?", (user_id,))
+
+def _find_login(email: str, conn):
     c = conn.cursor()
-    c.execute("SELECT id, role, tenant, password_hash FROM users WHERE email=?", (data.email,))
-    user = c.fetchone()
-    conn.close()
+    c.execute("SELECT id, role, tenant, password_hash FROM users WHERE email=?", (email,))
+    return c.fetchone()
+
+def _store_password_hash(user_id: str, password_hash: str, conn):
+    conn.cursor().execute("UPDATE users SET password_hash=? WHERE id=?", (password_hash, user_id))
+
+@app.post("/login", tags=["Auth"])
+async def login(data: LoginModel, request: Request):
+    user = await adb.run(_find_login, data.email)
 
-    if not user or user[3] != hash_password(data.password):
+    if not await password_hasher.verify(data.password, user[3] if user else None):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
+    # Legacy SHA-256 or outdated cost parameters: upgrade while we have the plaintext
+    if password_hasher.needs_rehash(user[3]):
+        await adb.run(_store_password_hash, user[0], await password_hasher.hash(data.password))
+
     token = create_token({"user_id": user[0], "role": user[1], "tenant": user[2]})
     log_audit(user[0], user[1], "User Login", request.client.host if request.client else "unknown")
     
     return {"access_token": token, "token_type": "bearer", "role": user[1], "tenant": user[2]}
 
+@app.post("/logout", tags=["Auth"])
+async def logout(token: str = Depends(oauth2_scheme), user=Depends(get_current_user)):
+    token_cache.revoke(token, user.get("exp"))
+    return {"message": "Logged out"}
+
 # ===============================================================
 # 2. ADMIN MODULE
 # ===============================================================
 
 @app.post("/admin/services", tags=["Admin"])
-def add_service(service: ServiceModel, request: Request, user=Depends(require_role(["admin", "tech"]))):
-    conn = get_db()
+@db_endpoint
+def add_service(service: ServiceModel, request: Request, user=Depends(require_role(["admin", "tech"])), conn=DBSession):
     c = conn.cursor()
     service_id = str(uuid.uuid4())
     c.execute("INSERT INTO services VALUES (?, ?, ?, ?, ?, ?)",
               (service_id, service.name, service.category, service.price, service.mitra_commission, service.tenant))
-    conn.commit()
-    conn.close()
+    bump_catalog_version(conn)
     log_audit(user["user_id"], user["role"], f"Added service {service.name}", request.client.host if request.client else "unknown")
     return {"message": "Service added successfully", "service_id": service_id}
 
 @app.put("/admin/mitra/{mitra_id}/approve", tags=["Admin"])
-def approve_mitra(mitra_id: str, request: Request, user=Depends(require_role(["admin"]))):
-    conn = get_db()
+@db_endpoint
+def approve_mitra(mitra_id: str, request: Request, user=Depends(require_role(["admin"])), conn=DBSession):
     c = conn.cursor()
     c.execute("UPDATE users SET kyc_status='approved' WHERE id=? AND role='mitra'", (mitra_id,))
-    conn.commit()
-    conn.close()
+    c.execute("SELECT tenant FROM users WHERE id=?", (mitra_id,))
+    row = c.fetchone()
+    if row and not tenant_router.is_home(row[0]):
+        with tenant_router.connection(row[0]) as shard:
+            shard.cursor().execute("UPDATE users SET kyc_status='approved' WHERE id=?", (mitra_id,))
     log_audit(user["user_id"], user["role"], f"Approved mitra {mitra_id}", request.client.host if request.client else "unknown")
     return {"message": "Mitra approved"}
 
 @app.post("/admin/nbfc", tags=["Admin"])
-def add_nbfc(nbfc: NBFCModel, request: Request, user=Depends(require_role(["admin", "tech"]))):
-    conn = get_db()
+@db_endpoint
+def add_nbfc(nbfc: NBFCModel, request: Request, user=Depends(require_role(["admin", "tech"])), conn=DBSession):
     c = conn.cursor()
     nbfc_id = str(uuid.uuid4())
     c.execute("INSERT INTO nbfc_partners VALUES (?, ?, ?, ?, ?)",
               (nbfc_id, nbfc.name, nbfc.api_endpoint, nbfc.commission_rate, True))
-    conn.commit()
-    conn.close()
     log_audit(user["user_id"], user["role"], f"Added NBFC {nbfc.name}", request.client.host if request.client else "unknown")
     return {"message": "NBFC Partner added", "nbfc_id": nbfc_id}
 
 @app.get("/admin/analytics", tags=["Admin"])
-def view_analytics(user=Depends(require_role(["admin", "tech", "govt"]))):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM users WHERE role='mitra'")
-    total_mitras = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM service_requests")
-    total_requests = c.fetchone()[0]
-    c.execute("SELECT SUM(amount) FROM ledger WHERE type='credit'")
-    total_revenue = c.fetchone()[0] or 0
-    c.execute("SELECT * FROM state_analytics")
-    state_metrics = c.fetchall()
-    conn.close()
-    
-    return {
-        "total_mitras": total_mitras,
-        "total_requests": total_requests,
-        "total_revenue": total_revenue,
-        "state_metrics": [{"state": row[1], "revenue": row[2], "requests": row[3]} for row in state_metrics]
-    }
+async def view_analytics(request: Request, user=Depends(require_role(["admin", "tech", "govt"]))):
+    cache_headers = {"Cache-Control": f"private, max-age={int(ANALYTICS_CACHE_TTL)}"}
+    etag = analytics_cache.peek_etag()
+    if etag and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, **cache_headers})
+
+    body, etag = await adb.call(analytics_cache.get)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, **cache_headers})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, **cache_headers})
 
 @app.get("/admin/audit-logs", tags=["Admin"])
-def view_audit_logs(user=Depends(require_role(["admin", "govt", "tech"]))):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT * FROM audit_logs ORDER BY timestamp DESC LIMIT 100")
-    logs = c.fetchall()
-    conn.close()
-    return [{"id": l[0], "user_id": l[1], "role": l[2], "action": l[3], "ip": l[4], "time": l[5]} for l in logs]
+@db_endpoint
+def view_audit_logs(cursor: Optional[str] = None,
+                    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), format: str = "json",
+                    user=Depends(require_role(["admin", "govt", "tech"])), conn=DBSession):
+    queries = audit_partitions.queries(conn.cursor(), AuditRow.select("{audit}"), [], [], ("timestamp", "id"), cursor)
+    if format == "ndjson":
+        return ndjson_export_across(queries, AuditRow)
+    return list_page_across(conn, queries, AuditRow, limit)
+
+@app.get("/admin/audit-logs/archive", tags=["Admin"])
+def search_archived_audit_logs(user_id: Optional[str] = None, tenant: Optional[str] = None,
+                               start: Optional[datetime] = None, end: Optional[datetime] = None,
+                               limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                               user=Depends(require_role(["admin", "govt", "tech"]))):
+    # Govt users only ever see their own state's archive
+    if user["role"] == "govt":
+        tenant = user["tenant"]
+    # Archived rows carry stored (UTC) timestamps, so aware bounds are converted first
+    try:
+        start, end = (format_timestamp(t) if t else None for t in (start, end))
+    except (OverflowError, ValueError):
+        raise HTTPException(status_code=400, detail="start and end must be valid timestamps")
+    return FastJSONResponse(search_audit_archives(user_id, tenant, start, end, limit))
 
 # ===============================================================
 # 3. MITRA MODULE
 # ===============================================================
 
 @app.post("/mitra/requests", tags=["Mitra"])
-def create_request(req: RequestModel, request: Request, user=Depends(require_role(["mitra"]))):
-    conn = get_db()
+@db_endpoint
+@idempotent
+def create_request(req: RequestModel, request: Request, user=Depends(require_role(["mitra"])), conn=TenantSession):
     c = conn.cursor()
     req_id = str(uuid.uuid4())
+    now = utc_timestamp()
     c.execute("INSERT INTO service_requests VALUES (?, ?, ?, ?, ?, ?, ?)",
-              (req_id, req.citizen_name, req.msme_id, user["user_id"], req.service_id, "in_progress", str(datetime.utcnow())))
-    conn.commit()
-    conn.close()
+              (req_id, req.citizen_name, req.msme_id, user["user_id"], req.service_id, "in_progress", now))
     
-    update_state_analytics(user["tenant"], requests=1)
+    update_state_analytics(conn, user["tenant"], requests=1)
+    service = service_catalog.get(req.service_id, tenant_router.home_conn(user["tenant"], conn))
+    update_rollups(conn, rollup_deltas(user["tenant"], now, service[2] if service else None, user["user_id"],
+                                       requests=1))
+    bump_counters(conn, total_requests=1)
     log_audit(user["user_id"], user["role"], f"Created request {req_id}", request.client.host if request.client else "unknown")
     return {"message": "Service request created", "request_id": req_id}
 
 @app.post("/mitra/requests/{req_id}/complete", tags=["Mitra"])
-def complete_request(req_id: str, request: Request, user=Depends(require_role(["mitra"]))):
-    conn = get_db()
+@db_endpoint
+@idempotent
+def complete_request(req_id: str, request: Request, user=Depends(require_role(["mitra"])), conn=TenantSession):
     c = conn.cursor()
     
-    c.execute("SELECT service_id, status FROM service_requests WHERE id=? AND mitra_id=?", (req_id, user["user_id"]))
-    req_data = c.fetchone()
-    if not req_data or req_data[1] == 'completed':
+    # Flip the status first: the guarded UPDATE takes the row (SQLite: the write lock), so of
+    # two concurrent attempts exactly one sees rowcount 1 and goes on to credit the ledger
+    c.execute("UPDATE service_requests SET status='completed' WHERE id=? AND mitra_id=? AND status != 'completed'",
+              (req_id, user["user_id"]))
+    if c.rowcount != 1:
         raise HTTPException(status_code=400, detail="Invalid or already completed request")
-        
-    c.execute("SELECT mitra_commission, price FROM services WHERE id=?", (req_data[0],))
-    service_data = c.fetchone()
-    commission = service_data[0]
-    price = service_data[1]
+    c.execute("SELECT service_id FROM service_requests WHERE id=?", (req_id,))
+    service_data = service_catalog.get(c.fetchone()[0], tenant_router.home_conn(user["tenant"], conn))
+    commission = service_data[4]
+    price = service_data[3]
     
     # Auto-credit commission to ledger
-    c.execute("INSERT INTO ledger VALUES (?, ?, ?, ?, ?, ?)",
-              (str(uuid.uuid4()), user["user_id"], commission, "credit", req_id, str(datetime.utcnow())))
-    
-    c.execute("UPDATE service_requests SET status='completed' WHERE id=?", (req_id,))
-    conn.commit()
-    conn.close()
+    record_ledger_entry(conn, user["user_id"], commission, "credit", req_id)
     
-    update_state_analytics(user["tenant"], revenue=price)
+    update_state_analytics(conn, user["tenant"], revenue=price)
+    update_rollups(conn, rollup_deltas(user["tenant"], utc_timestamp(), service_data[2], user["user_id"],
+                                       completed=1, revenue=price, commission=commission))
+    bump_counters(conn, total_revenue=commission)
     log_audit(user["user_id"], user["role"], f"Completed request {req_id}", request.client.host if request.client else "unknown")
     return {"message": "Request completed and commission credited", "commission_earned": commission}
 
 @app.get("/mitra/wallet", tags=["Mitra"])
-def view_wallet(user=Depends(require_role(["mitra"]))):
-    conn = get_db()
+@db_endpoint
+def view_wallet(user=Depends(require_role(["mitra"])), conn=TenantSession):
     c = conn.cursor()
-    c.execute("SELECT SUM(amount) FROM ledger WHERE mitra_id=? AND type='credit'", (user["user_id"],))
-    credits = c.fetchone()[0] or 0
-    c.execute("SELECT SUM(amount) FROM ledger WHERE mitra_id=? AND type='debit'", (user["user_id"],))
-    debits = c.fetchone()[0] or 0
-    conn.close()
+    c.execute("SELECT credits, debits FROM wallet_balances WHERE mitra_id=?", (user["user_id"],))
+    row = c.fetchone()
+    credits, debits = (row[0], row[1]) if row else (0, 0)
     return {"balance": credits - debits, "total_earned": credits}
 
 @app.post("/mitra/loans", tags=["Mitra"])
-def apply_loan(loan: LoanModel, request: Request, user=Depends(require_role(["mitra"]))):
-    # Trigger credit scoring function (mocked)
-    credit_score = 750 if len(loan.gstin) == 15 else 600
+@db_endpoint
+@idempotent
+def apply_loan(loan: LoanModel, request: Request, user=Depends(require_role(["mitra"])), conn=TenantSession):
+    credit_score = credit_scorer.score(conn, user["user_id"], loan.gstin)["score"]
     
-    conn = get_db()
     c = conn.cursor()
     loan_id = str(uuid.uuid4())
     c.execute("INSERT INTO loan_applications VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
               (loan_id, loan.applicant_name, user["user_id"], loan.nbfc_partner_id, 
-               loan.gstin, credit_score, loan.requested_amount, "submitted", str(datetime.utcnow())))
-    conn.commit()
-    conn.close()
+               loan.gstin, credit_score, loan.requested_amount, "submitted", utc_timestamp()))
     
     log_audit(user["user_id"], user["role"], f"Applied for loan {loan_id}", request.client.host if request.client else "unknown")
     return {"message": "Loan application submitted", "loan_id": loan_id, "calculated_score": credit_score}
 
 @app.get("/mitra/loans", tags=["Mitra"])
-def view_loan_status(user=Depends(require_role(["mitra"]))):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT * FROM loan_applications WHERE mitra_id=?", (user["user_id"],))
-    loans = c.fetchall()
-    conn.close()
-    return [{"id": l[0], "applicant": l[1], "amount": l[6], "status": l[7]} for l in loans]
+@db_endpoint
+def view_loan_status(cursor: Optional[str] = None,
+                     limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), format: str = "json",
+                     user=Depends(require_role(["mitra"])), conn=TenantSession):
+    sql, params = keyset_query(MitraLoanRow.select("loan_applications"), ["mitra_id=?"], [user["user_id"]],
+                               ("created_at", "id"), cursor)
+    if format == "ndjson":
+        return ndjson_export(sql, params, MitraLoanRow, tenant_router.pool(user["tenant"]))
+    return list_page(conn, sql, params, MitraLoanRow, limit)
 
 # ===============================================================
 # 4. MSME MODULE
 # ===============================================================
 
 @app.get("/msme/services", tags=["MSME"])
-def msme_services(user=Depends(require_role(["msme"]))):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT * FROM services WHERE tenant=?", (user["tenant"],))
-    services = c.fetchall()
-    conn.close()
-    return [{"id": s[0], "name": s[1], "price": s[3]} for s in services]
+async def msme_services(user=Depends(require_role(["msme"]))):
+    # Hot path: pre-serialized bytes straight from the catalog, no DB and no encoder
+    if not service_catalog.is_fresh():
+        await adb.call(service_catalog.refresh)
+    return Response(content=service_catalog.listing(user["tenant"]), media_type="application/json")
 
 @app.get("/msme/credit-score", tags=["MSME"])
-def msme_credit_score(user=Depends(require_role(["msme"]))):
-    # Mock credit score retrieval
-    return {"msme_id": user["user_id"], "credit_score": 720, "last_updated": str(datetime.utcnow())}
+@db_endpoint
+def msme_credit_score(gstin: Optional[str] = None, user=Depends(require_role(["msme"])), conn=TenantSession):
+    result = credit_scorer.score(conn, user["user_id"], gstin)
+    return {"msme_id": user["user_id"], "credit_score": result["score"],
+            "default_probability": result["default_probability"], "last_updated": utc_timestamp()}
 
 # ===============================================================
 # 5. NBFC MODULE
 # ===============================================================
 
+# Partners serve every state, so these read and write across all tenant shards
+
 @app.get("/nbfc/loans", tags=["NBFC"])
-def nbfc_view_loans(user=Depends(require_role(["nbfc"]))):
+def nbfc_view_loans(cursor: Optional[str] = None,
+                    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), format: str = "json",
+                    user=Depends(require_role(["nbfc"]))):
     # In a real app, filter by NBFC partner ID linked to this user
-    conn = get_db()
+    # Oldest first, so partners work the queue in submission order
+    sql, params = keyset_query(LoanQueueRow.select("loan_applications"), ["status='submitted'"], [],
+                               ("created_at", "id"), cursor, descending=False)
+    if format == "ndjson":
+        return ndjson_export_sharded(sql, params, LoanQueueRow, descending=False)
+    return list_page_sharded(sql, params, LoanQueueRow, limit, descending=False)
+
+def _score_shard_queue(partner_id: str, conn) -> List[tuple]:
     c = conn.cursor()
-    c.execute("SELECT * FROM loan_applications WHERE status='submitted'")
+    c.execute("""SELECT id, mitra_id, gstin, created_at FROM loan_applications
+        WHERE nbfc_partner_id=? AND status='submitted' ORDER BY created_at, id""", (partner_id,))
     loans = c.fetchall()
-    conn.close()
-    return [{"id": l[0], "applicant": l[1], "gstin": l[4], "score": l[5], "amount": l[6]} for l in loans]
+    results = credit_scorer.score_many(conn, [(mitra_id, gstin) for _, mitra_id, gstin, _ in loans])
+    c.executemany("UPDATE loan_applications SET credit_score=? WHERE id=?",
+                  [(r["score"], loan[0]) for loan, r in zip(loans, results)])
+    return [(loan[3], loan[0], r) for loan, r in zip(loans, results)]
+
+@app.post("/nbfc/partners/{partner_id}/loans/score", tags=["NBFC"])
+def score_partner_queue(partner_id: str, request: Request, user=Depends(require_role(["nbfc", "admin"]))):
+    # Re-score the partner's whole submitted queue, one batch per shard, and store the scores
+    scored = list(heapq.merge(*tenant_router.fan_out(_score_shard_queue, partner_id)))
+    log_audit(user["user_id"], user["role"], f"Scored {len(scored)} loans for partner {partner_id}",
+              request.client.host if request.client else "unknown")
+    return {"partner_id": partner_id, "scored": len(scored),
+            "results": [{"loan_id": loan_id, **r} for _, loan_id, r in scored]}
+
+def _set_loan_status(loan_id: str, status: str, conn) -> int:
+    c = conn.cursor()
+    c.execute("UPDATE loan_applications SET status=? WHERE id=?", (status, loan_id))
+    return c.rowcount
 
 @app.put("/nbfc/loans/{loan_id}/status", tags=["NBFC"])
 def update_loan_status(loan_id: str, status: str, request: Request, user=Depends(require_role(["nbfc"]))):
     if status not in ["approved", "rejected", "disbursed"]:
         raise HTTPException(status_code=400, detail="Invalid status")
         
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("UPDATE loan_applications SET status=? WHERE id=?", (status, loan_id))
-    conn.commit()
-    conn.close()
+    # Loan ids carry no tenant; the row exists on exactly one shard
+    tenant_router.fan_out(_set_loan_status, loan_id, status)
     
     log_audit(user["user_id"], user["role"], f"Updated loan {loan_id} to {status}", request.client.host if request.client else "unknown")
     return {"message": f"Loan {status}"}
@@ -483,31 +3260,62 @@ def update_loan_status(loan_id: str, status: str, request: Request, user=Depends
 # ===============================================================
 
 @app.get("/govt/analytics", tags=["Government"])
-def govt_analytics(user=Depends(require_role(["govt"]))):
-    conn = get_db()
+@db_endpoint
+def govt_analytics(user=Depends(require_role(["govt"])), conn=TenantSession):
     c = conn.cursor()
     # Govt user can only see their state's analytics
     c.execute("SELECT * FROM state_analytics WHERE state=?", (user["tenant"],))
     row = c.fetchone()
-    conn.close()
     if not row:
         return {"state": user["tenant"], "total_revenue": 0, "total_requests": 0}
     return {"state": row[1], "total_revenue": row[2], "total_requests": row[3], "last_updated": row[4]}
 
+@app.get("/govt/analytics/range", tags=["Government"])
+async def govt_analytics_range(start: datetime, end: datetime, dimension: str = "tenant", key: Optional[str] = None,
+                               series: Optional[str] = None, tenant: Optional[str] = None,
+                               user=Depends(require_role(["govt", "admin"]))):
+    # Hour resolution over [start, end); govt users are pinned to their own state
+    if dimension not in ROLLUP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of {', '.join(ROLLUP_DIMENSIONS)}")
+    if series is not None and series not in dict(ROLLUP_GRAINS):
+        raise HTTPException(status_code=400, detail="series must be hour or day")
+    # Buckets are UTC: compare (and later bucket) both bounds as naive UTC, whichever of them carried an offset
+    try:
+        start, end = utc_naive(start), utc_naive(end)
+    except (OverflowError, ValueError):
+        raise HTTPException(status_code=400, detail="start and end must be valid timestamps")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    state = user["tenant"] if user["role"] == "govt" or not tenant else tenant
+    result = await adb.run_on(tenant_router.pool(state), _analytics_range, state, start, end, dimension, key, series)
+    return FastJSONResponse(result)
+
+def _analytics_range(state: str, start: datetime, end: datetime, dimension: str, key: Optional[str],
+                     series: Optional[str], conn) -> dict:
+    totals = query_rollups(conn, state, start, end, dimension, key)
+    result = {
+        "state": state,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "dimension": dimension,
+        "breakdown": [{"key": k, "requests": v[0], "completed": v[1], "revenue": v[2], "commission": v[3]}
+                      for k, v in sorted(totals.items())],
+    }
+    if series:
+        result["series"] = rollup_series(conn, state, start, end, series, dimension, key)
+    return result
+
 @app.get("/govt/compliance-logs", tags=["Government"])
-def govt_compliance_logs(user=Depends(require_role(["govt"]))):
-    conn = get_db()
-    c = conn.cursor()
+@db_endpoint
+def govt_compliance_logs(cursor: Optional[str] = None,
+                         limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), format: str = "json",
+                         user=Depends(require_role(["govt"])), conn=DBSession):
     # Filter logs by users in the same tenant state
-    c.execute("""
-        SELECT a.* FROM audit_logs a
-        JOIN users u ON a.user_id = u.id
-        WHERE u.tenant = ?
-        ORDER BY a.timestamp DESC LIMIT 100
-    """, (user["tenant"],))
-    logs = c.fetchall()
-    conn.close()
-    return [{"id": l[0], "user_id": l[1], "action": l[3], "time": l[5]} for l in logs]
+    queries = audit_partitions.queries(conn.cursor(), ComplianceRow.select("{audit} a JOIN users u ON a.user_id = u.id"),
+                                       ["u.tenant = ?"], [user["tenant"]], ("a.timestamp", "a.id"), cursor)
+    if format == "ndjson":
+        return ndjson_export_across(queries, ComplianceRow)
+    return list_page_across(conn, queries, ComplianceRow, limit)
 
 # ===============================================================
 # 7. AI MODULE
@@ -515,28 +3323,282 @@ def govt_compliance_logs(user=Depends(require_role(["govt"]))):
 
 @app.post("/ai/gst-analysis", tags=["AI"])
 def ai_gst_analysis(query: AIQueryModel, user=Depends(require_role(["admin", "mitra", "msme"]))):
-    # Mock AI response returning structured JSON
+    # Small inline returns; same pipeline as the streaming upload, collected into one response
+    data = query.data.encode()
+    lines, offset = [], 0
+    for line in data.splitlines(keepends=True):
+        lines.append((offset, line))
+        offset += len(line)
+    header = None
+    if lines and not lines[0][1].lstrip().startswith(b"{"):
+        header = parse_gst_header(lines.pop(0)[1])
+    index = InvoiceIndex(GST_INDEX_MAX_ENTRIES, GST_SPOOL_DIR)
+    try:
+        *results, summary = reconcile_gst(parse_gst_lines(lines, header), index)
+    finally:
+        index.close()
+    summary = summary["summary"]
     return {
         "status": "success",
         "analysis": {
-            "risk_level": "Low",
-            "compliance_score": 92,
-            "recommendations": ["File GSTR-3B by 20th", "Reconcile GSTR-2A mismatches"]
-        }
+            "risk_level": summary["risk_level"],
+            "compliance_score": summary["compliance_score"],
+            "recommendations": gst_recommendations(summary),
+            "summary": summary
+        },
+        "results": results
     }
 
+@app.post("/ai/gst-analysis/stream", tags=["AI"])
+async def ai_gst_analysis_stream(request: Request, user=Depends(require_role(["admin", "mitra", "msme"]))):
+    # Spool the upload to disk first: parsing then never competes with the body for memory,
+    # and worker processes can each read their own byte range of the file
+    is_ndjson = "ndjson" in request.headers.get("content-type", "")
+    fd, path = tempfile.mkstemp(prefix="gst-upload-", dir=GST_SPOOL_DIR)
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            async for piece in request.stream():
+                size += len(piece)
+                if size > GST_MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="Upload too large")
+                await run_in_threadpool(f.write, piece)
+        header, start = read_gst_header(path, is_ndjson)
+    except BaseException:
+        os.unlink(path)
+        raise
+    log_audit(user["user_id"], user["role"], f"GST reconciliation of {size} bytes",
+              request.client.host if request.client else "unknown")
+
+    def stream():
+        index = InvoiceIndex(GST_INDEX_MAX_ENTRIES, GST_SPOOL_DIR)
+        try:
+            buffered, pending = 0, []
+            for result in reconcile_gst(iter_gst_records(path, header, start, GST_PARSE_WORKERS), index):
+                line = json.dumps(result) + "\n"
+                pending.append(line)
+                buffered += len(line)
+                if buffered >= 65536:
+                    yield "".join(pending)
+                    buffered, pending = 0, []
+            yield "".join(pending)
+        finally:
+            index.close()
+    # The upload is removed with the response, even if the client leaves before the first chunk
+    return CleanupStreamingResponse(stream(), functools.partial(os.unlink, path), media_type="application/x-ndjson")
+
 @app.post("/ai/credit-score", tags=["AI"])
-def ai_credit_score(query: AIQueryModel, user=Depends(require_role(["nbfc", "admin"]))):
-    # Mock AI response returning structured JSON
+@db_endpoint
+def ai_credit_score(query: AIQueryModel, user=Depends(require_role(["nbfc", "admin"])), conn=DBSession):
+    # data is an applicant id, or JSON {"applicant_id": ..., "gstin": ...}
+    try:
+        subject = json.loads(query.data)
+    except ValueError:
+        subject = {"applicant_id": query.data}
+    if not isinstance(subject, dict) or not subject.get("applicant_id"):
+        raise HTTPException(status_code=400, detail="data must name an applicant_id")
+    # The applicant's features live on their tenant's shard
+    c = conn.cursor()
+    c.execute("SELECT tenant FROM users WHERE id=?", (subject["applicant_id"],))
+    row = c.fetchone()
+    with tenant_router.connection(row[0] if row else "", conn) as shard:
+        result = credit_scorer.score(shard, subject["applicant_id"], subject.get("gstin"), explain=True)
     return {
         "status": "success",
         "prediction": {
-            "estimated_score": 745,
-            "default_probability": 0.04,
-            "factors": ["Consistent GST filing", "High vintage", "Low credit utilization"]
+            "estimated_score": result["score"],
+            "default_probability": result["default_probability"],
+            "factors": result["factors"]
         }
     }
 
+# ===============================================================
+# 8. BULK INGESTION MODULE
+# ===============================================================
+# Body is a JSON array or, with Content-Type: application/x-ndjson, one object
+# per line streamed in. Rows are validated once, written BULK_CHUNK_SIZE at a
+# time with executemany (one transaction per chunk), and the analytics and
+# audit rows are rolled up per chunk. The response is a per-row manifest.
+# Chunks commit on their own, so with an Idempotency-Key each chunk's slice of
+# the manifest is stored in its transaction and a retry replays committed
+# chunks instead of writing them twice.
+
+async def iter_bulk_chunks(request: Request):
+    """Yield lists of (row_index, parsed_object_or_None, parse_error) in chunks."""
+    chunk = []
+    if "ndjson" in request.headers.get("content-type", ""):
+        index, buffer = 0, b""
+        async for piece in request.stream():
+            buffer += piece
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    chunk.append((index, json.loads(line), None))
+                except ValueError as e:
+                    chunk.append((index, None, f"Malformed JSON: {e}"))
+                index += 1
+                if len(chunk) >= BULK_CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+        if buffer.strip():
+            try:
+                chunk.append((index, json.loads(buffer), None))
+            except ValueError as e:
+                chunk.append((index, None, f"Malformed JSON: {e}"))
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        for index, row in enumerate(rows):
+            chunk.append((index, row, None))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def validate_chunk(chunk, model, results: List[dict]) -> list:
+    """Validate each row once; failures go straight into the manifest."""
+    valid = []
+    for index, obj, error in chunk:
+        if error is None:
+            try:
+                valid.append((index, model.model_validate(obj)))
+                continue
+            except ValidationError as e:
+                error = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors())
+        results.append({"row": index, "status": "error", "error": error})
+    return valid
+
+def _write_request_chunk(rows, user: dict, ip: str, conn) -> List[dict]:
+    c = conn.cursor()
+    catalog_conn = tenant_router.home_conn(user["tenant"], conn)
+    services = {service_id: service_catalog.get(service_id, catalog_conn) for service_id in {r.service_id for _, r in rows}}
+
+    # Rows imported as completed get what complete_request does, dated at their created_at
+    results, inserts, credits, deltas = [], [], [], []
+    revenue = commission = 0
+    now = utc_timestamp()
+    for index, r in rows:
+        service = services.get(r.service_id)
+        if service is None:
+            results.append({"row": index, "status": "error", "error": f"Unknown service {r.service_id}"})
+        elif r.status not in ("in_progress", "completed"):
+            results.append({"row": index, "status": "error", "error": f"Invalid status {r.status}"})
+        else:
+            req_id = str(uuid.uuid4())
+            created_at = format_timestamp(r.created_at) if r.created_at else now
+            inserts.append((req_id, r.citizen_name, r.msme_id, user["user_id"], r.service_id, r.status, created_at))
+            if r.status == "completed":
+                credits.append((str(uuid.uuid4()), user["user_id"], service[4], "credit", req_id, created_at))
+                deltas += rollup_deltas(user["tenant"], created_at, service[2], user["user_id"], requests=1,
+                                        completed=1, revenue=service[3], commission=service[4])
+                revenue += service[3]
+                commission += service[4]
+            else:
+                deltas += rollup_deltas(user["tenant"], created_at, service[2], user["user_id"], requests=1)
+            results.append({"row": index, "status": "created", "id": req_id})
+    if inserts:
+        c.executemany("INSERT INTO service_requests VALUES (?, ?, ?, ?, ?, ?, ?)", inserts)
+        if credits:
+            c.executemany("INSERT INTO ledger VALUES (?, ?, ?, ?, ?, ?)", credits)
+            c.execute(WALLET_BALANCE_UPSERT, (user["user_id"], commission, 0, now))
+        update_state_analytics(conn, user["tenant"], revenue=revenue, requests=len(inserts))
+        update_rollups(conn, deltas)
+        bump_counters(conn, total_requests=len(inserts), total_revenue=commission)
+        log_audit(user["user_id"], user["role"], f"Bulk imported {len(inserts)} requests", ip)
+    return results
+
+def _write_ledger_chunk(rows, user: dict, ip: str, conn) -> List[dict]:
+    results, inserts, balances = [], [], {}
+    now = utc_timestamp()
+    for index, r in rows:
+        if r.type not in ("credit", "debit"):
+            results.append({"row": index, "status": "error", "error": f"Invalid type {r.type}"})
+            continue
+        entry_id = str(uuid.uuid4())
+        inserts.append((entry_id, r.mitra_id, r.amount, r.type, r.reference_id,
+                        format_timestamp(r.created_at) if r.created_at else now))
+        credit, debit = balances.get(r.mitra_id, (0, 0))
+        balances[r.mitra_id] = (credit + r.amount, debit) if r.type == "credit" else (credit, debit + r.amount)
+        results.append({"row": index, "status": "created", "id": entry_id})
+    if inserts:
+        c = conn.cursor()
+        c.executemany("INSERT INTO ledger VALUES (?, ?, ?, ?, ?, ?)", inserts)
+        # One balance upsert per mitra in the chunk, not per ledger row
+        c.executemany(WALLET_BALANCE_UPSERT,
+                      [(mitra_id, credit, debit, now) for mitra_id, (credit, debit) in balances.items()])
+        bump_counters(conn, total_revenue=sum(credit for credit, _ in balances.values()))
+        log_audit(user["user_id"], user["role"], f"Bulk imported {len(inserts)} ledger entries", ip)
+    return results
+
+def write_chunk_once(writer, rows, user: dict, ip: str, key: Optional[str], conn) -> List[dict]:
+    """writer(rows, user, ip, conn), recorded under the request's Idempotency-Key in the same transaction."""
+    if not key:
+        return writer(rows, user, ip, conn)
+    # One claim per chunk (and per shard: each shard's part commits separately), keyed by its first row
+    chunk_key = f"{key}:bulk:{rows[0][0]}"
+    payload = [(index, r.model_dump()) for index, r in rows]
+    fingerprint = hashlib.sha256(f"{writer.__name__} {json.dumps(payload, sort_keys=True, default=str)}"
+                                 .encode()).hexdigest()
+    replay = idempotency_store.claim(conn, user["user_id"], chunk_key, fingerprint)
+    if replay is not None:
+        return json.loads(replay.body)
+    results = writer(rows, user, ip, conn)
+    idempotency_store.save(conn, user["user_id"], chunk_key, FastJSONResponse(results))
+    return results
+
+def _route_ledger_chunk(rows, user: dict, ip: str, key: Optional[str], conn) -> List[dict]:
+    """Split a ledger chunk by each mitra's tenant and write every part on its shard (one transaction each)."""
+    mitra_ids = sorted({r.mitra_id for _, r in rows})
+    c = conn.cursor()
+    c.execute(f"SELECT id, tenant FROM users WHERE role='mitra' AND id IN ({', '.join('?' * len(mitra_ids))})",
+              mitra_ids)
+    tenants = dict(c.fetchall())
+    by_pool: dict = {}
+    results = []
+    for index, r in rows:
+        if r.mitra_id not in tenants:
+            results.append({"row": index, "status": "error", "error": f"Unknown mitra {r.mitra_id}"})
+            continue
+        tenant = tenants[r.mitra_id]
+        try:
+            pool = tenant_router.pool(tenant)
+        except HTTPException as e:
+            results.append({"row": index, "status": "error", "error": e.detail})
+            continue
+        by_pool.setdefault(pool, (tenant, []))[1].append((index, r))
+    for tenant, part in by_pool.values():
+        with tenant_router.connection(tenant, conn) as shard:
+            results += write_chunk_once(_write_ledger_chunk, part, user, ip, key, shard)
+    return results
+
+async def ingest(request: Request, model, writer, user: dict, pool: Optional[ConnectionPool] = None) -> dict:
+    ip = request.client.host if request.client else "unknown"
+    key = request.headers.get("idempotency-key")
+    results: List[dict] = []
+    async for chunk in iter_bulk_chunks(request):
+        valid = validate_chunk(chunk, model, results)
+        if valid:
+            results += await adb.run_on(pool or db_pool, writer, valid, user, ip, key)
+    results.sort(key=lambda r: r["row"])
+    created = sum(1 for r in results if r["status"] == "created")
+    return {"received": len(results), "created": created, "failed": len(results) - created, "results": results}
+
+@app.post("/mitra/requests/bulk", tags=["Mitra"])
+async def bulk_create_requests(request: Request, user=Depends(require_role(["mitra"]))):
+    return await ingest(request, BulkRequestModel, functools.partial(write_chunk_once, _write_request_chunk), user,
+                        tenant_router.pool(user["tenant"]))
+
+@app.post("/admin/ledger/bulk", tags=["Admin"])
+async def bulk_ledger_entries(request: Request, user=Depends(require_role(["admin"]))):
+    return await ingest(request, LedgerEntryModel, _route_ledger_chunk, user)
+
 # ===============================================================
 # ROOT
 # ===============================================================
@@ -547,13 +3609,270 @@ def root():
         "platform": "VyaparKendra National Stakeholder-Integrated Platform",
         "status": "Operational",
         "version": "2.0.0",
-        "modules": ["Auth", "Admin", "Mitra", "MSME", "NBFC", "Government", "AI"]
+        "modules": ["Auth", "Admin", "Mitra", "MSME", "NBFC", "Government", "AI", "Bulk"]
     }
 
+@app.get("/system/db-pool", tags=["System"])
+def db_pool_stats(user=Depends(require_role(["admin", "tech"]))):
+    stats = db_pool.stats()
+    if tenant_router.enabled:
+        stats["shards"] = tenant_router.stats()
+    return stats
+
+@app.get("/system/token-cache", tags=["System"])
+def token_cache_stats(user=Depends(require_role(["admin", "tech"]))):
+    return token_cache.stats()
+
+@app.get("/system/credit-score-cache", tags=["System"])
+def credit_score_cache_stats(user=Depends(require_role(["admin", "tech"]))):
+    return credit_scorer.stats()
+
+@app.get("/system/audit-queue", tags=["System"])
+def audit_queue_stats(user=Depends(require_role(["admin", "tech"]))):
+    return audit_writer.stats()
+
+@app.get("/metrics", tags=["System"])
+def prometheus_metrics():
+    # Unauthenticated like any scrape target; keep it off the public ingress
+    pool, audit, tokens = db_pool.stats(), audit_writer.stats(), token_cache.stats()
+    return Response(content=metrics.render([
+        ("vk_db_connections_opened_total", "counter", "Connections opened by the pool.", pool["opened"]),
+        ("vk_db_connections_recycled_total", "counter", "Connections closed for age.", pool["recycled"]),
+        ("vk_db_pool_in_use", "gauge", "Connections currently checked out.", pool["in_use"]),
+        ("vk_db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection.", pool["wait_seconds_total"]),
+        ("vk_db_pool_timeouts_total", "counter", "Acquires that gave up with a 503.", pool["timeouts"]),
+        ("vk_audit_queue_depth", "gauge", "Audit rows waiting to be written.", audit["queued"]),
+        ("vk_audit_written_total", "counter", "Audit rows written.", audit["written"]),
+        ("vk_audit_dropped_total", "counter", "Audit rows dropped by backpressure.", audit["dropped"]),
+        ("vk_audit_failed_total", "counter", "Audit rows lost to write errors.", audit["failed"]),
+        ("vk_token_cache_hits_total", "counter", "JWT claims served from cache.", tokens["hits"]),
+        ("vk_token_cache_misses_total", "counter", "JWT claims decoded and verified.", tokens["misses"]),
+    ]), media_type="text/plain; version=0.0.4")
+
+# ===============================================================
+# QUERY PLAN CHECKS
+# ===============================================================
+
+# (name, sql, params, must be served in index order, index the plan must use or None)
+HOT_QUERIES = [
+    ("wallet", "SELECT credits, debits FROM wallet_balances WHERE mitra_id=?", ("m",), False, None),
+    ("analytics_version", "SELECT value FROM platform_counters WHERE name='version'", (), False, None),
+    ("mitra_loans", """SELECT * FROM loan_applications WHERE mitra_id=? AND (created_at, id) < (?, ?)
+        ORDER BY created_at DESC, id DESC LIMIT 101""", ("m", "t", "id"), True, "idx_loans_mitra_keyset"),
+    ("nbfc_loans", """SELECT * FROM loan_applications WHERE status='submitted' AND (created_at, id) > (?, ?)
+        ORDER BY created_at ASC, id ASC LIMIT 101""", ("t", "id"), True, "idx_loans_status_keyset"),
+    ("catalog_version", "SELECT value FROM platform_counters WHERE name='catalog_version'", (), False, None),
+    ("rollup_range", """SELECT key, SUM(revenue) FROM analytics_rollups
+        WHERE grain='day' AND tenant=? AND dimension='tenant' AND bucket >= ? AND bucket < ? GROUP BY key""",
+     ("MH", "2026-01-01", "2026-02-01"), False, None),
+    ("partner_queue", """SELECT id, mitra_id, gstin FROM loan_applications
+        WHERE nbfc_partner_id=? AND status='submitted' ORDER BY created_at, id""", ("p",), True, "idx_loans_partner_status"),
+    ("audit_logs", """SELECT * FROM {audit} WHERE (timestamp, id) < (?, ?)
+        ORDER BY timestamp DESC, id DESC LIMIT 101""", ("t", "id"), True, None),
+    ("compliance_logs", """SELECT a.* FROM {audit} a JOIN users u ON a.user_id = u.id
+        WHERE u.tenant = ? AND (a.timestamp, a.id) < (?, ?)
+        ORDER BY a.timestamp DESC, a.id DESC LIMIT 101""", ("MH", "t", "id"), False, None),
+]
+
+def explain_hot_queries(conn) -> List[dict]:
+    """Run EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (Postgres) over HOT_QUERIES.
+
+    A query regresses when it falls back to a full table scan, when it must
+    be served in index order but needs a separate sort step, or when it does
+    not use the index it was given. Read-only: with no audit partition yet
+    (SQLite), the audit queries are reported as skipped.
+    """
+    c = conn.cursor()
+    if DATABASE_URL:
+        # Tiny tables always favour a seq scan; ask whether an index path exists at all
+        c.execute("SET LOCAL enable_seqscan = off")
+    # Audit queries are planned against the parent (Postgres) or the newest day partition (SQLite)
+    days = [] if DATABASE_URL else audit_partitions.list(c)
+    audit = "audit_logs" if DATABASE_URL else audit_partitions.table(days[0]) if days else None
+    report = []
+    for name, sql, params, ordered, index in HOT_QUERIES:
+        if "{audit}" in sql:
+            if audit is None:
+                report.append({"query": name, "plan": [], "problems": [], "skipped": "no audit partition yet"})
+                continue
+            sql = sql.replace("{audit}", audit)
+        if DATABASE_URL:
+            c.execute("EXPLAIN " + sql.replace("?", "%s"), params)
+            plan = [row[0] for row in c.fetchall()]
+            problems = [p.strip() for p in plan if "Seq Scan" in p]
+            if ordered:
+                problems += [p.strip() for p in plan if p.strip().startswith("->  Sort") or p.startswith("Sort")]
+        else:
+            c.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [row[3] for row in c.fetchall()]
+            problems = [p for p in plan if p.startswith("SCAN") and " USING " not in p]
+            if ordered:
+                problems += [p for p in plan if "TEMP B-TREE" in p]
+        if index and not any(index in p for p in plan):
+            problems.append(f"does not use {index}")
+        report.append({"query": name, "plan": plan, "problems": problems})
+    return report
+
+@app.get("/system/query-plans", tags=["System"])
+@db_endpoint
+def query_plans(user=Depends(require_role(["admin", "tech"])), conn=DBSession):
+    return explain_hot_queries(conn)
+
+# ===============================================================
+# SHARD SPLIT
+# ===============================================================
+
+TENANT_MITRAS = "mitra_id IN (SELECT id FROM users WHERE tenant = ?)"
+
+# (table, predicate selecting one tenant's rows); users are copied separately and never pruned
+SHARD_TABLES = [
+    ("service_requests", TENANT_MITRAS),
+    ("ledger", TENANT_MITRAS),
+    ("wallet_balances", TENANT_MITRAS),
+    ("loan_applications", TENANT_MITRAS),
+    ("idempotency_keys", "user_id IN (SELECT id FROM users WHERE tenant = ?)"),
+    ("state_analytics", "state = ?"),
+    ("analytics_rollups", "tenant = ?"),
+]
+
+def _copy_rows(src, dst, table: str, select: str, params: tuple) -> int:
+    src.execute(select, params)
+    copied = 0
+    while True:
+        rows = src.fetchmany(EXPORT_FETCH_SIZE)
+        if not rows:
+            return copied
+        dst.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(rows[0]))}) ON CONFLICT DO NOTHING", rows)
+        copied += len(rows)
+
+def split_shards(tenants: Optional[List[str]] = None) -> List[dict]:
+    """Move each tenant's rows out of the home database onto its shard.
+
+    Per tenant: copy its users (without password hashes) and SHARD_TABLES rows
+    to the shard, set the shard's counters from what it now holds, and commit
+    the shard; then delete the moved rows from home and take them off the home
+    counters. Copies skip rows the shard already has, so an interrupted split
+    can be re-run. Run it with the app stopped.
+    """
+    if tenants is None:
+        with db_pool.connection() as home:
+            c = home.cursor()
+            c.execute("SELECT DISTINCT tenant FROM users")
+            tenants = sorted(row[0] for row in c.fetchall() if row[0])
+    report = []
+    for tenant in tenants:
+        if tenant_router.pool(tenant, create=True) is db_pool:
+            continue
+        moved = {"tenant": tenant, "shard": tenant_router.pool(tenant).dsn}
+        # Exits innermost first: the shard commits before home deletes anything
+        with db_pool.connection() as home, tenant_router.connection(tenant) as shard:
+            src, dst = home.cursor(), shard.cursor()
+            moved["users"] = _copy_rows(src, dst, "users", """SELECT id, name, email, NULL, role, tenant, kyc_status,
+                created_at FROM users WHERE tenant = ?""", (tenant,))
+            for table, predicate in SHARD_TABLES:
+                moved[table] = _copy_rows(src, dst, table, f"SELECT * FROM {table} WHERE {predicate}", (tenant,))
+            dst.execute("UPDATE platform_counters SET value = (SELECT COUNT(*) FROM service_requests) "
+                        "WHERE name='total_requests'")
+            dst.execute("UPDATE platform_counters SET value = (SELECT COALESCE(SUM(amount), 0) FROM ledger "
+                        "WHERE type='credit') WHERE name='total_revenue'")
+            dst.execute("UPDATE platform_counters SET value = value + 1 WHERE name='version'")
+
+            src.execute(f"SELECT COUNT(*) FROM service_requests WHERE {TENANT_MITRAS}", (tenant,))
+            requests = src.fetchone()[0]
+            src.execute(f"SELECT COALESCE(SUM(amount), 0) FROM ledger WHERE type='credit' AND {TENANT_MITRAS}",
+                        (tenant,))
+            revenue = src.fetchone()[0]
+            for table, predicate in SHARD_TABLES:
+                src.execute(f"DELETE FROM {table} WHERE {predicate}", (tenant,))
+            bump_counters(home, total_requests=-requests, total_revenue=-revenue)
+        report.append(moved)
+    return report
+
+# ===============================================================
+# COMMAND LINE
+# ===============================================================
+# python main.py migrate       -> apply pending schema migrations
+# python main.py check-plans   -> exit 1 if a hot query lost its index
+# python main.py reconcile-wallets [--fix] -> exit 1 if balances drifted from the ledger
+# python main.py backfill-rollups  -> rebuild analytics_rollups from requests and the ledger
+# python main.py archive-audit-logs [--retention-days N] -> archive and drop old audit partitions
+# python main.py split-shards [--tenant MH ...] -> move tenants' rows from the home database to their shards
+#
+# migrate, reconcile-wallets and backfill-rollups run against the home database and every shard.
+
+def _cli_per_database(args, conn, catalog_conn=None) -> int:
+    if args.command == "reconcile-wallets":
+        drift = reconcile_wallets(conn, fix=args.fix)
+        for d in drift:
+            print(f"{d['mitra_id']}: ledger {d['ledger_credits']}/{d['ledger_debits']} "
+                  f"stored {d['stored_credits']}/{d['stored_debits']}")
+        print(f"{len(drift)} wallet(s) drifted" + (", repaired" if drift and args.fix else ""))
+        return 1 if drift and not args.fix else 0
+    started = time.perf_counter()
+    events = backfill_rollups(conn, catalog_conn)
+    print(f"Rolled up {events} events in {time.perf_counter() - started:.1f}s")
+    return 0
+
+def cli(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(prog="main.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate")
+    sub.add_parser("check-plans")
+    reconcile = sub.add_parser("reconcile-wallets")
+    reconcile.add_argument("--fix", action="store_true", help="overwrite drifted balances with ledger totals")
+    sub.add_parser("backfill-rollups")
+    archive = sub.add_parser("archive-audit-logs")
+    archive.add_argument("--retention-days", type=int, default=AUDIT_RETENTION_DAYS)
+    split = sub.add_parser("split-shards")
+    split.add_argument("--tenant", action="append", help="only these tenants (default: every tenant with a shard)")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        for tenant, pool in [(None, db_pool)] + tenant_router.shards():
+            applied = migrate(pool)
+            print(("" if tenant is None else f"[{tenant}] ") + f"Applied migrations: {applied or 'none pending'}")
+        return 0
+    if MIGRATE_ON_STARTUP:
+        init_db()
+    if args.command == "split-shards":
+        if not tenant_router.enabled:
+            print("Sharding is off: set SHARD_DIR or SHARD_MAP first")
+            return 1
+        for moved in split_shards(args.tenant):
+            counts = ", ".join(f"{n} {table}" for table, n in moved.items() if table not in ("tenant", "shard"))
+            print(f"{moved['tenant']} -> {moved['shard']}: {counts}")
+        return 0
+    if args.command in ("reconcile-wallets", "backfill-rollups"):
+        status = 0
+        for tenant, pool in [(None, db_pool)] + tenant_router.shards():
+            if tenant is not None:
+                print(f"[{tenant}]")
+            with pool.connection() as conn:
+                status = max(status, _cli_per_database(args, conn, catalog_conn=conn if pool is db_pool else None))
+        return status
+
+    with db_pool.connection() as conn:
+        if args.command == "check-plans":
+            failed = False
+            for entry in explain_hot_queries(conn):
+                status = "FAIL" if entry["problems"] else "skip" if entry.get("skipped") else "ok"
+                failed = failed or bool(entry["problems"])
+                print(f"[{status}] {entry['query']}: {entry.get('skipped') or ' | '.join(entry['plan'])}")
+            return 1 if failed else 0
+        if args.command == "archive-audit-logs":
+            for meta in archive_audit_partitions(conn, args.retention_days):
+                print(f"{meta['day']}: {meta['rows']} rows -> {meta['file']}")
+            return 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(cli())
+
 # ===============================================================
 # RUN INSTRUCTIONS
 # ===============================================================
-# pip install fastapi uvicorn psycopg2-binary pyjwt pydantic
+# pip install fastapi uvicorn psycopg2-binary pyjwt pydantic numpy
 # uvicorn main:app --host 0.0.0.0 --port 8000
 # For Production:
 # gunicorn main:app -k uvicorn.workers.UvicornWorker --workers 4 --bind 0.0.0.0:8000